@@ -1,27 +1,44 @@
-import base64
+import asyncio
 import logging
 import os
-import time
 import traceback
+import weakref
+from collections import deque
 from datetime import datetime
+from functools import lru_cache, partial
 from io import BytesIO
-from typing import Any, Final, List, Optional, Tuple, Type, cast
+from typing import Any, Callable, Final, List, Optional, Tuple, Type, cast
 
+import httpx
+import pybase64
 from agentdesk.device_v1 import Desktop
-from anthropic import Anthropic
+from anthropic import (
+    APIConnectionError,
+    AsyncAnthropic,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
 from anthropic.types.beta import (
     BetaMessageParam,
     BetaTextBlockParam,
     BetaToolResultBlockParam,
 )
 from devicebay import Device
+from PIL import Image
 from pydantic import BaseModel
 from rich.console import Console
 from rich.json import JSON
 from skillpacks import EnvState, V1Action
 from surfkit.agent import TaskAgent
 from taskara import Task, TaskStatus
-from tenacity import before_sleep_log, retry, stop_after_attempt
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 from toolfuse.util import AgentUtils
 
 from .anthropic import ToolResult, make_api_tool_result, response_to_params
@@ -34,21 +51,164 @@ console = Console(force_terminal=True)
 
 if not os.environ.get("ANTHROPIC_API_KEY"):
     raise ValueError("Please set the ANTHROPIC_API_KEY in your environment.")
-client = Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
+
+# httpx async connections are bound to the event loop that opened them, so keep one
+# client per loop; the sync solve_task wrapper starts a fresh loop on every call
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncAnthropic]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_client() -> AsyncAnthropic:
+    """Get the Anthropic client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncAnthropic(
+            api_key=os.environ["ANTHROPIC_API_KEY"],
+            # Keep connections alive across steps and multiplex concurrent tasks
+            http_client=DefaultAsyncHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+# Only transient API failures are worth another expensive attempt; anything else
+# (unknown actions, device errors, bad requests) fails the same way when retried
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+# Screenshots are downscaled to Claude's high-res limit and sent as JPEG
+MAX_SCREENSHOT_EDGE = 1568
+JPEG_QUALITY = 75
+SCREEN_UNCHANGED = "(screen unchanged)"
+
+# Actions whose visible effect is around the pointer
+POINTER_ACTIONS = {"click", "double_click", "drag_mouse", "move_mouse"}
+
+
+def _encode_screenshot(
+    img: Image.Image, box: Optional[Tuple[int, int, int, int]] = None
+) -> Tuple[bytes, str]:
+    """Downscale a screenshot to fit MAX_SCREENSHOT_EDGE and encode it as JPEG
+
+    Args:
+        img (Image.Image): The screenshot
+        box (Tuple[int, int, int, int], optional): Region of the downscaled screenshot
+            to keep, as (left, top, right, bottom). Defaults to the whole screenshot.
+
+    Returns:
+        Tuple[bytes, str]: The JPEG bytes and their base64 encoding
+    """
+    img = img.copy()
+    img.thumbnail((MAX_SCREENSHOT_EDGE, MAX_SCREENSHOT_EDGE), Image.LANCZOS)
+    if box:
+        img = img.crop(box)
+    buffer = BytesIO()
+    img.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    image_data = buffer.getvalue()
+    buffer.close()
+    return image_data, pybase64.b64encode(image_data).decode("ascii")
+
+
+async def _encode_screenshot_async(
+    img: Image.Image, box: Optional[Tuple[int, int, int, int]] = None
+) -> Tuple[bytes, str]:
+    """Run _encode_screenshot without blocking the event loop; Pillow releases the GIL
+    while resizing and encoding, so a thread is enough"""
+    return await asyncio.to_thread(_encode_screenshot, img, box)
+
+
+# The following prompt is a modified copy of the prompt from Anthropic's Computer Use Demo project
+# Some other code lines in this file are also copied from Anthropic's Computer Use Demo project
+# Original file: https://github.com/anthropics/anthropic-quickstarts/tree/main/computer-use-demo/computer_use_demo/tools
+
+SYSTEM_PROMPT = """<SYSTEM_CAPABILITY>
+        * You are utilising an Linux virtual machine of screen size {screen_size} with internet access.
+        * To open firefox, please just click on the web browser (globe) icon.
+        * When viewing a page it can be helpful to zoom out so that you can see everything on the page.  Either that, or make sure you scroll down to see everything before deciding something isn't available.
+        * When using your computer function calls, they take a while to run and send back to you.
+        * The ONLY tool you can use is the Computer Use tool. Therefore, whenever you are asked to do something, you should use the Computer Use tool to do it (including opening ternimal, opening and editing files, and other operations that can be done with a mouse and keyboard if necessary).
+        * The current date is {date}.
+        </SYSTEM_CAPABILITY>
+
+        <IMPORTANT>
+        * When using Firefox, if a startup wizard appears, IGNORE IT.  Do not even click "skip this step".  Instead, click on the address bar where it says "Search or enter address", and enter the appropriate search term or URL there.
+        * If the item you are looking at is a pdf, if after taking a single screenshot of the pdf it seems that you want to read the entire document instead of trying to continue to read the pdf from your screenshots + navigation, determine the URL, use curl to download the pdf, install and use pdftotext to convert it to a text file, and then read that text file directly with your StrReplaceEditTool.
+        * When you open Google and see a cookie consent popup, click on the "Accept all" button (in any language). If the button is not visible, scroll down until you see it. Before scrolling, move the mouse closer to the header of the cookie consent popup.
+        * ALWAYS close the cookie consent popup on ANY website where you see it before continuing.
+        </IMPORTANT>"""
+
+
+@lru_cache(maxsize=8)
+def _system_prompt(
+    screen_size_x: int, screen_size_y: int, date: str
+) -> Tuple[BetaTextBlockParam, ...]:
+    """Build the system prompt once per screen size and date, so every request of a
+    task passes the very same object"""
+    screen_size = {"x": screen_size_x, "y": screen_size_y}
+    return (
+        BetaTextBlockParam(
+            type="text",
+            text=SYSTEM_PROMPT.format(screen_size=screen_size, date=date),
+        ),
+    )
+
+
+@lru_cache(maxsize=8)
+def _computer_tools(display_width: int, display_height: int) -> Tuple[dict, ...]:
+    """Define Anthropic Computer Use tool. Refer to the docs at https://docs.anthropic.com/en/docs/build-with-claude/computer-use#computer-tool"""
+    return (
+        {
+            "type": "computer_20241022",
+            "name": "computer",
+            "display_width_px": display_width,
+            "display_height_px": display_height,
+            "display_number": 1,
+        },
+    )
 
 
 class ClaudeComputerUseConfig(BaseModel):
-    pass
+    # Send only a window around the pointer after pointer actions, instead of the
+    # full screen; the full screen is still sent every `full_screen_every` steps
+    crop_screenshots: bool = os.getenv("CROP_SCREENSHOTS", "false") == "true"
+    crop_size: Tuple[int, int] = (800, 600)
+    full_screen_every: int = 5
 
 
 class ClaudeComputerUse(TaskAgent):  # type: ignore
     """A GUI desktop agent that slices up the image"""
 
+    def __init__(self, config: Optional[ClaudeComputerUseConfig] = None) -> None:
+        super().__init__()
+        self.config = config or ClaudeComputerUseConfig()
+
     def solve_task(
         self,
         task: Task,
         device: Optional[Device] = None,  # type: ignore
         max_steps: int = 30,
+    ) -> Task:
+        """Solve a task, blocking until it is done
+
+        Args:
+            task (Task): Task to solve.
+            device (Device): Device to perform the task on.
+            max_steps (int, optional): Max steps to try and solve. Defaults to 30.
+
+        Returns:
+            Task: The task
+        """
+        return asyncio.run(self.asolve_task(task, device, max_steps))
+
+    async def asolve_task(
+        self,
+        task: Task,
+        device: Optional[Device] = None,  # type: ignore
+        max_steps: int = 30,
     ) -> Task:
         """Solve a task
 
@@ -60,14 +220,34 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
         Returns:
             Task: The task
         """
+        # Blocking taskara calls of this task, run one by one off the event loop
+        self._background_calls: deque[Tuple[asyncio.Future, Callable[[], Any]]] = (
+            deque()
+        )
+        self._background_worker: Optional[asyncio.Task] = None
+
+        try:
+            return await self._solve_task(task, device, max_steps)
+        finally:
+            # Every message and action must reach the tracker before the task is over
+            if self._background_worker:
+                await self._background_worker
 
+    async def _solve_task(
+        self,
+        task: Task,
+        device: Optional[Device],  # type: ignore
+        max_steps: int,
+    ) -> Task:
         # Post a message to the default thread to let the user know the task is in progress
-        task.post_message("assistant", f"Starting task '{task.description}'")
+        self._post_message(task, "assistant", f"Starting task '{task.description}'")
 
         # Create threads in the task to update the user
         console.print("creating threads...")
-        task.ensure_thread("debug")
-        task.post_message("assistant", "I'll post debug messages here", thread="debug")
+        self._fire_and_forget(task.ensure_thread, "debug")
+        self._post_message(
+            task, "assistant", "I'll post debug messages here", thread="debug"
+        )
 
         # Check that the device we received is one we support
         if not isinstance(device, Desktop):
@@ -81,19 +261,32 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
         screen_size = info["screen_size"]
         console.print(f"Desktop info: {screen_size}")
 
-        # Define Anthropic Computer Use tool. Refer to the docs at https://docs.anthropic.com/en/docs/build-with-claude/computer-use#computer-tool
-        self.tools = [
-            {
-                "type": "computer_20241022",
-                "name": "computer",
-                "display_width_px": screen_size["x"],
-                "display_height_px": screen_size["y"],
-                "display_number": 1,
-            },
-        ]
+        # The model only sees downscaled screenshots, so it has to be told the downscaled
+        # display size, and the coordinates it returns have to be scaled back up
+        self.screenshot_scale = min(
+            1.0, MAX_SCREENSHOT_EDGE / max(screen_size["x"], screen_size["y"])
+        )
+
+        self.display_size = (
+            round(screen_size["x"] * self.screenshot_scale),
+            round(screen_size["y"] * self.screenshot_scale),
+        )
+        self.tools = _computer_tools(*self.display_size)
 
-        console.print("tools: ", style="purple")
-        console.print(JSON.from_data(self.tools))
+        if logger.isEnabledFor(logging.DEBUG):
+            console.print("tools: ", style="purple")
+            console.print(JSON.from_data(self.tools))
+
+        # Tool results that still carry images, oldest first, with their image counts
+        self._tool_result_refs: deque[Tuple[BetaToolResultBlockParam, int]] = deque()
+        self._total_images = 0
+
+        # The last screenshot sent to the model, to avoid sending an identical one again
+        self._last_image_data: Optional[bytes] = None
+
+        # Where the model last put the pointer, and steps since the last full screenshot
+        self._last_pointer_xy: Optional[Tuple[int, int]] = None
+        self._steps_since_full_screen = 0
 
         # Create our thread and start with the task description and system prompt
         messages: list[BetaMessageParam] = []
@@ -108,75 +301,98 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
             }
         )
 
-        # The following prompt is a modified copy of the prompt from Anthropic's Computer Use Demo project
-        # Some other code lines in this file are also copied from Anthropic's Computer Use Demo project
-        # Original file: https://github.com/anthropics/anthropic-quickstarts/tree/main/computer-use-demo/computer_use_demo/tools
-
-        SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
-        * You are utilising an Linux virtual machine of screen size {screen_size} with internet access.
-        * To open firefox, please just click on the web browser (globe) icon.
-        * When viewing a page it can be helpful to zoom out so that you can see everything on the page.  Either that, or make sure you scroll down to see everything before deciding something isn't available.
-        * When using your computer function calls, they take a while to run and send back to you.
-        * The ONLY tool you can use is the Computer Use tool. Therefore, whenever you are asked to do something, you should use the Computer Use tool to do it (including opening ternimal, opening and editing files, and other operations that can be done with a mouse and keyboard if necessary).
-        * The current date is {datetime.today().strftime("%A, %B %-d, %Y")}.
-        </SYSTEM_CAPABILITY>
-
-        <IMPORTANT>
-        * When using Firefox, if a startup wizard appears, IGNORE IT.  Do not even click "skip this step".  Instead, click on the address bar where it says "Search or enter address", and enter the appropriate search term or URL there.
-        * If the item you are looking at is a pdf, if after taking a single screenshot of the pdf it seems that you want to read the entire document instead of trying to continue to read the pdf from your screenshots + navigation, determine the URL, use curl to download the pdf, install and use pdftotext to convert it to a text file, and then read that text file directly with your StrReplaceEditTool.
-        * When you open Google and see a cookie consent popup, click on the "Accept all" button (in any language). If the button is not visible, scroll down until you see it. Before scrolling, move the mouse closer to the header of the cookie consent popup.
-        * ALWAYS close the cookie consent popup on ANY website where you see it before continuing.
-        </IMPORTANT>"""
-
-        self.system = BetaTextBlockParam(
-            type="text",
-            text=f"{SYSTEM_PROMPT}",
+        # The prompt has to describe the same downscaled display as the tool
+        self.system = _system_prompt(
+            *self.display_size, datetime.today().strftime("%A, %B %-d, %Y")
         )
 
-        self.action_mapping = {
-            "key": "hot_key",
-            "type": "type_text",
-            "mouse_move": "move_mouse",
-            "left_click": "click",
-            "left_click_drag": "drag_mouse",
-            "right_click": "click",
-            "middle_click": "click",
-            "double_click": "double_click",
-            "screenshot": "take_screenshots",
-            "cursor_position": "mouse_coordinates",
+        # Claude action name -> (AgentDesk action name, extra parameters)
+        self.action_mapping: dict[str, Tuple[str, dict[str, Any]]] = {
+            "key": ("hot_key", {}),
+            "type": ("type_text", {}),
+            "mouse_move": ("move_mouse", {}),
+            "left_click": ("click", {}),
+            "left_click_drag": ("drag_mouse", {}),
+            "right_click": ("click", {"button": "right"}),
+            "middle_click": ("click", {"button": "middle"}),
+            "double_click": ("double_click", {}),
+            "screenshot": ("take_screenshots", {}),
+            "cursor_position": ("mouse_coordinates", {}),
+        }
+
+        # AgentDesk action name -> conversion of Claude's parameters to AgentDesk's
+        self._param_transforms: dict[
+            str, Callable[[dict[str, Any]], dict[str, Any]]
+        ] = {
+            "move_mouse": self._coordinate_to_xy,
+            "drag_mouse": self._coordinate_to_xy,
+            "hot_key": self._text_to_keys,
+            "press_key": self._normalize_key,
         }
 
         for i in range(max_steps):
             console.print(f"-------step {i + 1}", style="green")
 
             try:
-                messages, done = self.take_action(device, task, messages)
+                messages, done = await self.take_action(device, task, messages)
             except Exception as e:
                 console.print(f"Error: {e}", style="red")
                 task.status = TaskStatus.FAILED
                 task.error = str(e)
-                task.save()
-                task.post_message("assistant", f"❗ Error taking action: {e}")
+                await self._in_background(task.save)
+                self._post_message(task, "assistant", f"❗ Error taking action: {e}")
                 return task
 
             if done:
                 console.print("task is done", style="green")
                 return task
 
-            time.sleep(2)
+            await asyncio.sleep(2)
 
         task.status = TaskStatus.FAILED
-        task.save()
-        task.post_message("assistant", "❗ Max steps reached without solving task")
+        await self._in_background(task.save)
+        self._post_message(
+            task, "assistant", "❗ Max steps reached without solving task"
+        )
         console.print("Reached max steps without solving task", style="red")
 
         return task
 
+    @classmethod
+    async def asolve_many(
+        cls,
+        pairs: List[Tuple[Task, Device]],  # type: ignore
+        concurrency: int = 8,
+        max_steps: int = 30,
+    ) -> List[Task]:
+        """Solve several tasks concurrently, each one on its own device
+
+        Args:
+            pairs (List[Tuple[Task, Device]]): Tasks to solve with the devices to perform them on.
+            concurrency (int, optional): Max tasks in flight, to stay under the API rate limits. Defaults to 8.
+            max_steps (int, optional): Max steps to try and solve each task. Defaults to 30.
+
+        Returns:
+            List[Task]: The tasks, in the order they were given
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def solve(task: Task, device: Device) -> Task:  # type: ignore
+            async with semaphore:
+                # Every task gets its own agent, as the agent keeps per-task state
+                return await cls.default().asolve_task(task, device, max_steps)
+
+        return list(
+            await asyncio.gather(*(solve(task, device) for task, device in pairs))
+        )
+
     @retry(
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        wait=wait_random_exponential(multiplier=1, max=30),
         stop=stop_after_attempt(5),
         before_sleep=before_sleep_log(logger, logging.INFO),
     )
-    def take_action(
+    async def take_action(
         self,
         device: Desktop,
         task: Task,
@@ -195,7 +411,7 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
         try:
             # Check to see if the task has been cancelled
             if task.remote:
-                task.refresh()
+                await self._in_background(task.refresh)
             console.print("Task status: ", task.status.value)
             if (
                 task.status == TaskStatus.CANCELING
@@ -204,7 +420,7 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
                 console.print(f"Task is {task.status}", style="red")
                 if task.status == TaskStatus.CANCELING:
                     task.status = TaskStatus.CANCELED
-                    task.save()
+                    await self._in_background(task.save)
                 return messages, True
 
             console.print("Starting action...", style="yellow")
@@ -212,17 +428,31 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
             messages = self._maybe_filter_to_n_most_recent_images(messages, 3, 2)
 
             model = os.getenv("SURFKIT_AGENT_MODEL", "claude-3-5-sonnet-20241022")
-            raw_response = client.beta.messages.with_raw_response.create(
+            posted_text_blocks: set[int] = set()
+            async with get_client().beta.messages.stream(
                 max_tokens=4096,
                 messages=messages,
                 model=model,
-                system=[self.system],
+                system=self.system,
                 tools=self.tools,
                 betas=["computer-use-2024-10-22"],
-            )
+            ) as stream:
+                async for event in stream:
+                    # Text preceding a tool use explains the upcoming action, so it can
+                    # be shown while the tool input is still being generated
+                    if (
+                        event.type == "content_block_start"
+                        and event.content_block.type == "tool_use"
+                    ):
+                        snapshot = stream.current_message_snapshot
+                        for index, block in enumerate(snapshot.content):
+                            if block.type == "text" and index not in posted_text_blocks:
+                                self._post_thought(task, block.text)
+                                posted_text_blocks.add(index)
+
+                response = await stream.get_final_message()
 
             try:
-                response = raw_response.parse()
                 response_params = response_to_params(response)
 
                 messages.append(
@@ -239,21 +469,24 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
             # The agent will return 'end_turn' if it believes it's finished
             if response.stop_reason == "end_turn":
                 console.print("Final result: ", style="green")
-                console.print(JSON.from_data(response_params[0]))
+                console.print(response_params[0]["text"])
 
-                task.post_message(
+                self._post_message(
+                    task,
                     "assistant",
                     f"✅ I think the task is done, please review the result: {response_params[0]['text']}",
                 )
                 task.status = TaskStatus.FINISHED
-                task.save()
+                await self._in_background(task.save)
 
                 metadata: dict[str, Any] = {
                     "input_tokens": response.usage.input_tokens,
                     "output_tokens": response.usage.output_tokens,
                 }
-                screenshot_img = device.take_screenshots()[0]
-                task.record_action(
+                screenshots = await asyncio.to_thread(device.take_screenshots)
+                screenshot_img = screenshots[0]
+                self._record_action(
+                    task,
                     state=EnvState(images=[screenshot_img]),
                     action=V1Action(
                         name="result", parameters={"value": response_params[0]["text"]}
@@ -267,33 +500,33 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
             tool_result_content: list[BetaToolResultBlockParam] = []
 
             thought = ""
-            for content_block in response_params:
+            for index, content_block in enumerate(response_params):
                 if content_block["type"] == "text":
-                    task.post_message("assistant", f"👁️ {content_block.get('text')}")
-                    console.print(f"👁️ {content_block.get('text')}", style="blue")
-                    thought += content_block.get("text") + "\n"
+                    if index not in posted_text_blocks:
+                        self._post_thought(task, content_block["text"])
+                    thought += content_block["text"] + "\n"
                 elif content_block["type"] == "tool_use":
                     input_args = cast(dict[str, Any], content_block["input"])
 
-                    action_name = self.action_mapping[input_args["action"]]
-                    action_params = input_args.copy()
-                    if input_args["action"] == "right_click":
-                        action_params["button"] = "right"
-                    if input_args["action"] == "middle_click":
-                        action_params["button"] = "middle"
+                    action_name, extra_params = self.action_mapping[
+                        input_args["action"]
+                    ]
+                    action_params = {
+                        k: v for k, v in input_args.items() if k != "action"
+                    }
+                    action_params.update(extra_params)
 
                     console.print(
                         f"Found action: {action_name} with params: {input_args}",
                         style="blue",
                     )
 
-                    task.post_message(
+                    self._post_message(
+                        task,
                         "assistant",
                         f"▶️ Taking action '{action_name}' with parameters: {input_args}",
                     )
 
-                    del action_params["action"]
-
                     # Find the selected action in the tool
                     action = device.find_action(action_name)
                     console.print(f"Found action: {action}", style="blue")
@@ -302,48 +535,78 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
                         raise SystemError("action not found")
 
                     # Take the selected action
+                    action_response = None
                     try:
                         if (
                             action_name != "take_screenshots"
                         ):  # Do not execute if the action is screenshot, coz we take the screenshot later anyway
-                            action_params = self._get_mapped_action_params(
-                                action_name, action_params
+                            transform = self._param_transforms.get(action_name)
+                            if transform:
+                                action_params = transform(action_params)
+                            action_response = await asyncio.to_thread(
+                                device.use, action, **action_params
                             )
-                            action_response = device.use(action, **action_params)
+                    except Exception as e:
+                        raise ValueError(f"Trouble using action: {e}") from e
 
-                            console.print(
-                                f"action output: {action_response}", style="blue"
+                    if action_name != "take_screenshots":
+                        console.print(f"action output: {action_response}", style="blue")
+
+                        if action_response:
+                            self._post_message(
+                                task,
+                                "assistant",
+                                f"👁️ Result from taking action: {action_response}",
                             )
 
-                            if action_response:
-                                task.post_message(
-                                    "assistant",
-                                    f"👁️ Result from taking action: {action_response}",
-                                )
-                    except Exception as e:
-                        raise ValueError(f"Trouble using action: {e}")
+                    if "coordinate" in input_args:
+                        self._last_pointer_xy = tuple(input_args["coordinate"])
+                    crop_box = self._screenshot_crop_box(action_name)
 
                     # Take the screenshot after executing the action, or if the action itself is screenshot
-                    screenshot_img = device.take_screenshots()[0]
-                    buffer = BytesIO()
-                    screenshot_img.save(buffer, format="PNG")
-                    image_data = buffer.getvalue()
-                    buffer.close()
-                    base64_image = base64.b64encode(image_data).decode("utf-8")
-
+                    screenshots = await asyncio.to_thread(device.take_screenshots)
+                    image_data, base64_image = await _encode_screenshot_async(
+                        screenshots[0], crop_box
+                    )
+                    # The encoded JPEG is only sent to the model; the full resolution
+                    # capture is recorded, as the trajectory is scored from it
+                    screenshot_img = screenshots[0]
+
+                    outputs: list[str] = []
+                    result_image: Optional[str] = base64_image
+                    if action_name == "mouse_coordinates" and action_response:
+                        outputs.append(self._cursor_position_output(action_response))
+
+                    # An action with no visible effect produces the very same JPEG, and
+                    # the model already has that frame in its context
+                    if image_data == self._last_image_data:
+                        outputs.append(SCREEN_UNCHANGED)
+                        result_image = None
+                    elif crop_box:
+                        outputs.append(
+                            f"The screenshot only shows the screen region from {crop_box[:2]} "
+                            f"to {crop_box[2:]}, add {crop_box[:2]} to positions within it"
+                        )
                     result = ToolResult(
-                        output=None, error=None, base64_image=base64_image
+                        output="\n".join(outputs) or None,
+                        error=None,
+                        base64_image=result_image,
                     )
+                    self._last_image_data = image_data
 
-                    task.post_message(
-                        "assistant",
-                        "Current Image",
-                        images=[screenshot_img],
-                        thread="debug",
-                    )
+                    if logger.isEnabledFor(logging.DEBUG):
+                        self._post_message(
+                            task,
+                            "assistant",
+                            "Current Image",
+                            images=[screenshot_img],
+                            thread="debug",
+                        )
 
                     tool_result_content.append(
-                        make_api_tool_result(result, content_block["id"])
+                        make_api_tool_result(
+                            result, content_block["id"], media_type="image/jpeg"
+                        )
                     )
 
                     metadata: dict[str, Any] = {
@@ -351,7 +614,8 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
                         "output_tokens": response.usage.output_tokens,
                         "thought": thought,
                     }
-                    task.record_action(
+                    self._record_action(
+                        task,
                         state=EnvState(images=[screenshot_img]),
                         action=V1Action(name=action_name, parameters=action_params),
                         tool=device.ref(),
@@ -362,14 +626,95 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
                 return messages, True
 
             messages.append({"content": tool_result_content, "role": "user"})
+            self._track_tool_result_images(tool_result_content)
 
             return messages, False
 
         except Exception as e:
             console.print("Exception taking action: ", e)
             traceback.print_exc()
-            task.post_message("assistant", f"⚠️ Error taking action: {e} -- retrying...")
-            raise e
+            if isinstance(e, RETRYABLE_ERRORS):
+                self._post_message(
+                    task, "assistant", f"⚠️ Error taking action: {e} -- retrying..."
+                )
+            raise
+
+    def _in_background(
+        self, func: Callable[..., Any], *args, **kwargs
+    ) -> asyncio.Future:
+        """Run a blocking taskara call off the event loop
+
+        Calls run one at a time, in the order they were made, since they all talk to
+        the same task. Await the returned future only when the result is needed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._background_calls.append((future, partial(func, *args, **kwargs)))
+        if self._background_worker is None or self._background_worker.done():
+            self._background_worker = asyncio.create_task(self._run_background_calls())
+        return future
+
+    async def _run_background_calls(self) -> None:
+        while self._background_calls:
+            future, call = self._background_calls.popleft()
+            try:
+                future.set_result(await asyncio.to_thread(call))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _fire_and_forget(self, func: Callable[..., Any], *args, **kwargs) -> None:
+        def log_failure(future: asyncio.Future) -> None:
+            if future.exception():
+                logger.warning(f"{func.__name__} failed: {future.exception()}")
+
+        self._in_background(func, *args, **kwargs).add_done_callback(log_failure)
+
+    def _post_message(self, task: Task, *args, **kwargs) -> None:
+        self._fire_and_forget(task.post_message, *args, **kwargs)
+
+    def _record_action(self, task: Task, **kwargs) -> None:
+        self._fire_and_forget(task.record_action, **kwargs)
+
+    def _screenshot_crop_box(
+        self, action_name: str
+    ) -> Optional[Tuple[int, int, int, int]]:
+        """Region of the (downscaled) screen to send after an action, or None for the
+        full screen"""
+        self._steps_since_full_screen += 1
+        if (
+            not self.config.crop_screenshots
+            or self._last_pointer_xy is None
+            or action_name not in POINTER_ACTIONS
+            or self._steps_since_full_screen >= self.config.full_screen_every
+        ):
+            self._steps_since_full_screen = 0
+            return None
+
+        width, height = self.display_size
+        crop_width = min(self.config.crop_size[0], width)
+        crop_height = min(self.config.crop_size[1], height)
+        x, y = self._last_pointer_xy
+        left = min(max(x - crop_width // 2, 0), width - crop_width)
+        top = min(max(y - crop_height // 2, 0), height - crop_height)
+        return (left, top, left + crop_width, top + crop_height)
+
+    def _post_thought(self, task: Task, text: str) -> None:
+        self._post_message(task, "assistant", f"👁️ {text}")
+        console.print(f"👁️ {text}", style="blue")
+
+    def _track_tool_result_images(
+        self, tool_result_content: list[BetaToolResultBlockParam]
+    ) -> None:
+        """Remember the tool results that carry images, so old images can be dropped
+        without rescanning the whole conversation"""
+        for tool_result in tool_result_content:
+            image_count = sum(
+                1
+                for content in tool_result["content"]
+                if content["type"] == "image"  # type: ignore
+            )
+            if image_count:
+                self._tool_result_refs.append((tool_result, image_count))
+                self._total_images += image_count
 
     def _maybe_filter_to_n_most_recent_images(
         self,
@@ -382,65 +727,64 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
         the conversation progresses, remove all but the final `images_to_keep` tool_result
         images in place, with a chunk of min_removal_threshold to reduce the amount we
         break the implicit prompt cache.
+
+        Only the tool results recorded by `_track_tool_result_images` are visited.
         """
         if images_to_keep == 0:
             return messages
 
-        tool_result_blocks = cast(
-            list[BetaToolResultBlockParam],
-            [
-                item
-                for message in messages
-                for item in (
-                    message["content"] if isinstance(message["content"], list) else []
-                )
-                if isinstance(item, dict) and item.get("type") == "tool_result"
-            ],
-        )
-
-        total_images = sum(
-            1
-            for tool_result in tool_result_blocks
-            for content in tool_result.get("content", [])
-            if isinstance(content, dict) and content.get("type") == "image"
-        )
-
-        images_to_remove = total_images - images_to_keep
+        images_to_remove = self._total_images - images_to_keep
         # for better cache behavior, we want to remove in chunks
         images_to_remove -= images_to_remove % min_removal_threshold
+        if images_to_remove <= 0:
+            return messages
 
-        for tool_result in tool_result_blocks:
-            if isinstance(tool_result.get("content"), list):
-                new_content = []
-                for content in tool_result.get("content", []):
-                    if isinstance(content, dict) and content.get("type") == "image":
-                        if images_to_remove > 0:
-                            images_to_remove -= 1
-                            continue
-                    new_content.append(content)
-                tool_result["content"] = new_content
+        while images_to_remove > 0 and self._tool_result_refs:
+            tool_result, image_count = self._tool_result_refs.popleft()
+            removed = min(image_count, images_to_remove)
+            new_content = []
+            skipped = 0
+            for content in tool_result["content"]:
+                if content["type"] == "image" and skipped < removed:  # type: ignore
+                    skipped += 1
+                    continue
+                new_content.append(content)
+            tool_result["content"] = new_content  # type: ignore
+            if removed < image_count:
+                self._tool_result_refs.appendleft((tool_result, image_count - removed))
+            self._total_images -= removed
+            images_to_remove -= removed
 
         return messages
 
-    def _get_mapped_action_params(
-        self, action_name: str, action_params: dict[str, Any]
-    ) -> dict[str, Any]:
-        if action_name != "screenshot":
-            if (
-                action_name in ["move_mouse", "drag_mouse"]
-                and "coordinate" in action_params
-            ):
-                action_params["x"] = action_params["coordinate"][0]
-                action_params["y"] = action_params["coordinate"][1]
-                del action_params["coordinate"]
-            if action_name == "hot_key" and "text" in action_params:
-                keys = action_params["text"].split("+")
-                keys = [key.strip().lower() for key in keys]
-                keys = [key.replace("_", "") for key in keys]
-                action_params["keys"] = keys
-                del action_params["text"]
-            if action_name == "press_key":
-                action_params["key"] = action_params["key"].replace("_", "").lower()
+    def _coordinate_to_xy(self, action_params: dict[str, Any]) -> dict[str, Any]:
+        if "coordinate" in action_params:
+            x, y = action_params.pop("coordinate")
+            action_params["x"] = round(x / self.screenshot_scale)
+            action_params["y"] = round(y / self.screenshot_scale)
+        return action_params
+
+    def _cursor_position_output(self, position: Any) -> str:
+        """Describe the pointer position in the downscaled coordinates the model uses"""
+        x, y = (
+            (position["x"], position["y"]) if isinstance(position, dict) else position
+        )
+        return (
+            f"X={round(x * self.screenshot_scale)},Y={round(y * self.screenshot_scale)}"
+        )
+
+    @staticmethod
+    def _text_to_keys(action_params: dict[str, Any]) -> dict[str, Any]:
+        if "text" in action_params:
+            action_params["keys"] = [
+                key.strip().lower().replace("_", "")
+                for key in action_params.pop("text").split("+")
+            ]
+        return action_params
+
+    @staticmethod
+    def _normalize_key(action_params: dict[str, Any]) -> dict[str, Any]:
+        action_params["key"] = action_params["key"].replace("_", "").lower()
         return action_params
 
     @classmethod
@@ -471,7 +815,7 @@ class ClaudeComputerUse(TaskAgent):  # type: ignore
         Returns:
             ClaudeComputerUse: The agent
         """
-        return ClaudeComputerUse()
+        return ClaudeComputerUse(config)
 
     @classmethod
     def default(cls) -> "ClaudeComputerUse":
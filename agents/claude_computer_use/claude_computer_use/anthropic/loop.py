@@ -26,14 +26,20 @@ def response_to_params(
     return res
 
 def make_api_tool_result(
-    result: ToolResult, tool_use_id: str
+    result: ToolResult, tool_use_id: str, media_type: str = "image/png"
 ) -> BetaToolResultBlockParam:
     """Convert an agent ToolResult to an API ToolResultBlockParam."""
-    tool_result_content: list[BetaTextBlockParam | BetaImageBlockParam] | str = []
+    # The content is always a list of blocks, so consumers never need to type-check it
+    tool_result_content: list[BetaTextBlockParam | BetaImageBlockParam] = []
     is_error = False
     if result.error:
         is_error = True
-        tool_result_content = _maybe_prepend_system_tool_result(result, result.error)
+        tool_result_content.append(
+            {
+                "type": "text",
+                "text": _maybe_prepend_system_tool_result(result, result.error),
+            }
+        )
     else:
         if result.output:
             tool_result_content.append(
@@ -48,7 +54,7 @@ def make_api_tool_result(
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
+                        "media_type": media_type,
                         "data": result.base64_image,
                     },
                 }
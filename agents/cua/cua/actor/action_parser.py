@@ -1,6 +1,6 @@
 # type: ignore
 
-from typing import Optional
+from typing import Callable, Optional
 
 from rich.console import Console
 from skillpacks.server.models import V1Action
@@ -61,6 +61,94 @@ AGENTDESK KEYS:
 """
 
 
+def _parse_click(action_args: dict) -> V1Action:
+    return V1Action(
+        name="click",
+        parameters={
+            "x": action_args["x"],
+            "y": action_args["y"],
+            "button": action_args.get("button", "left"),
+        },
+    )
+
+
+def _parse_double_click(action_args: dict) -> V1Action:
+    return V1Action(
+        name="double_click",
+        parameters={
+            "x": action_args["x"],
+            "y": action_args["y"],
+        },
+    )
+
+
+def _parse_scroll(action_args: dict) -> V1Action:
+    return V1Action(
+        name="scroll",
+        parameters={
+            "clicks": action_args["scroll_y"] // 10 * (-1),
+        },
+    )
+
+
+def _parse_type(action_args: dict) -> V1Action:
+    return V1Action(
+        name="type_text",
+        parameters={"text": action_args["text"]},
+    )
+
+
+def _parse_move(action_args: dict) -> V1Action:
+    return V1Action(
+        name="move_mouse",
+        parameters={"x": action_args["x"], "y": action_args["y"]},
+    )
+
+
+def _parse_keypress(action_args: dict) -> V1Action:
+    keys = [
+        CUA_KEY_TO_AGENTDESK_KEY.get(low_key, low_key)
+        for low_key in (key.lower() for key in action_args["keys"])
+    ]
+    return V1Action(
+        name="hot_key",
+        parameters={"keys": keys},
+    )
+
+
+def _parse_drag(action_args: dict) -> V1Action:
+    coords = action_args["path"][0]
+    if len(action_args["path"]) > 1:
+        coords = action_args["path"][1]
+    console.print(f"Dragging from {action_args['path'][0]} to {coords}")
+    return V1Action(
+        name="drag_mouse",
+        parameters={
+            "x": coords["x"],
+            "y": coords["y"],
+        },
+    )
+
+
+def _parse_wait(action_args: dict) -> V1Action:
+    return V1Action(
+        name="wait",
+        parameters={"seconds": action_args["ms"] // 1000 if "ms" in action_args else 1},
+    )
+
+
+_PARSERS: dict[str, Callable[[dict], V1Action]] = {
+    "click": _parse_click,
+    "double_click": _parse_double_click,
+    "scroll": _parse_scroll,
+    "type": _parse_type,
+    "move": _parse_move,
+    "keypress": _parse_keypress,
+    "drag": _parse_drag,
+    "wait": _parse_wait,
+}
+
+
 def parse_action(action_type: str, action_args: dict) -> Optional[V1Action]:
     """
     Parse the content into a list of V1Actions.
@@ -76,71 +164,5 @@ def parse_action(action_type: str, action_args: dict) -> Optional[V1Action]:
     drag(path)	                        drag([[24, 150], [100, 200]])
 
     """
-    action = None
-
-    if action_type == "click":
-        action = V1Action(
-            name="click",
-            parameters={
-                "x": action_args["x"],
-                "y": action_args["y"],
-                "button": action_args["button"] if "button" in action_args else "left",
-            },
-        )
-    elif action_type == "double_click":
-        action = V1Action(
-            name="double_click",
-            parameters={
-                "x": action_args["x"],
-                "y": action_args["y"],
-            },
-        )
-    elif action_type == "scroll":
-        action = V1Action(
-            name="scroll",
-            parameters={
-                "clicks": action_args["scroll_y"] // 10 * (-1),
-            },
-        )
-    elif action_type == "type":
-        action = V1Action(
-            name="type_text",
-            parameters={"text": action_args["text"]},
-        )
-    elif action_type == "move":
-        action = V1Action(
-            name="move_mouse",
-            parameters={"x": action_args["x"], "y": action_args["y"]},
-        )
-    elif action_type == "keypress":
-        keys = []
-        for key in action_args["keys"]:
-            low_key = key.lower()
-            if low_key in CUA_KEY_TO_AGENTDESK_KEY:
-                keys.append(CUA_KEY_TO_AGENTDESK_KEY[low_key])
-            else:
-                keys.append(low_key)
-        action = V1Action(
-            name="hot_key",
-            parameters={"keys": keys},
-        )
-    elif action_type == "drag":
-        coords = action_args["path"][0]
-        if len(action_args["path"]) > 1:
-            coords = action_args["path"][1]
-        console.print(f"Dragging from {action_args['path'][0]} to {coords}")
-        action = V1Action(
-            name="drag_mouse",
-            parameters={
-                "x": coords["x"],
-                "y": coords["y"],
-            },
-        )
-    elif action_type == "wait":
-        action = V1Action(
-            name="wait",
-            parameters={
-                "seconds": action_args["ms"] // 1000 if "ms" in action_args else 1
-            },
-        )
-    return action
+    parser = _PARSERS.get(action_type)
+    return parser(action_args) if parser else None
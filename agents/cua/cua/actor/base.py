@@ -41,3 +41,6 @@ class Actor(ABC, Generic[T]):
     @abstractmethod
     def act(self, task: Task, device: T, history: List[Step]) -> Step:
         pass
+
+    def invalidate_screenshot(self) -> None:
+        """Drop any cached screenshot, called after an action was taken on the device"""
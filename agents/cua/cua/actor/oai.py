@@ -1,26 +1,77 @@
 # type: ignore
 
+import base64
 import json
+import logging
 import os
-from typing import List, Optional
+import threading
+import time
+from collections import OrderedDict, deque
+from io import BytesIO
+from typing import TYPE_CHECKING, Final, List, Optional, Tuple
 
-import dotenv
 from agentdesk import Desktop
-from PIL import Image
 from rich.console import Console
 from skillpacks import EnvState, V1Action
-from skillpacks.img import image_to_b64
 from taskara import Task
 
 from .action_parser import parse_action
 from .base import Actor, Step
 from .utils import create_response
 
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger: Final = logging.getLogger(__name__)
+logger.setLevel(int(os.getenv("LOG_LEVEL", str(logging.DEBUG))))
+
 console = Console(force_terminal=True)
 
-dotenv.load_dotenv()
+SYSTEM_PROMPT = """You are a helpful assistant capable of navigating complex GUIs. 
+
+REMEMBER: 
+1. You can use mouse and keyboard to complete tasks on the computer.
+2. If you don't see the screen, make a screenshot before taking any action.
+3. You have to act autonomously; never ask user any questions; use your best judgement to figure out what to do next.
+4. Never send any messages to the user unless it's a final result of the task.
+5. When you return the next action, you should also return your reasoning for choosing this action.
+"""
+
+# Let the server keep the conversation with previous_response_id and only send new items.
+# The server then keeps every screenshot, so history compaction no longer applies.
+USE_PREVIOUS_RESPONSE = os.getenv("CUA_USE_PREVIOUS_RESPONSE", "false") == "true"
+
+# How long a screenshot can be reused, in seconds. This only covers the calls made
+# right after each other within a step; the screen can change on its own, so a
+# screenshot taken before a model call is never reused after it.
+SCREENSHOT_MAX_AGE = 0.2
+# Number of base64 encoded screenshots to keep around
+B64_CACHE_SIZE = 8
+# Screenshots are sent as JPEG, which is several times smaller than PNG
+JPEG_QUALITY = 85
+
+
+# Encoding buffer reused across screenshots, one per thread
+_buffers = threading.local()
+
+
+def _get_buffer() -> BytesIO:
+    """Return this thread's encoding buffer, emptied."""
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _buffers.buffer = BytesIO()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return buffer
+
 
-BASE64_ONE_PIXEL = image_to_b64(Image.new("RGB", (1, 1), (255, 255, 255)))
+def _screenshot_to_b64_jpeg(img: "Image.Image") -> str:
+    """Encode a screenshot as a base64 JPEG data URL."""
+    buffer = _get_buffer()
+    img.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY)
+    # The view must be released before the buffer can be truncated again
+    with buffer.getbuffer() as view:
+        return "data:image/jpeg;base64," + base64.b64encode(view).decode()
 
 
 class OaiActor(Actor[Desktop]):
@@ -36,33 +87,77 @@ class OaiActor(Actor[Desktop]):
                 "environment": "linux",
             },
         ]
-        self.items = []
+        # system prompt and task, built once and never mutated
+        self._static_prefix: Optional[List[dict]] = None
+        # model responses and call outputs, compacted to the last turns
+        self._rolling_items: deque[dict] = deque()
         self.last_call_id = None
         self.last_action_type = None
         self.last_reasoning = None
         self.keep_images = 5
+        # number of items in self._rolling_items that belong to each turn
+        self._turn_sizes: deque[int] = deque()
+        # last response, and the items added since, when the server keeps the conversation
+        self._previous_response_id: Optional[str] = None
+        self._new_items: List[dict] = []
+        self._cached_screenshot: Optional[Tuple[float, List["Image.Image"]]] = None
+        # id(image) -> (image, base64); the image is kept so its id can't be reused
+        self._b64_cache: OrderedDict[int, Tuple["Image.Image", str]] = OrderedDict()
+
+    def _get_screenshot(
+        self, device: Desktop, max_age: float = SCREENSHOT_MAX_AGE
+    ) -> List["Image.Image"]:
+        """Return the cached screenshot if it's fresh enough, otherwise take a new one."""
+        if self._cached_screenshot:
+            taken_at, screenshots = self._cached_screenshot
+            if time.monotonic() - taken_at < max_age:
+                return screenshots
 
-    def clean_up_old_screenshots(self):
-        """Remove all screenshots from the items list except for the last self.keep_images screenshots."""
-        n = self.keep_images
-        total_items = len(self.items)
-        for i in range(total_items, 0, -1):
-            item = self.items[i - 1]
-            if "type" in item and item["type"] == "computer_call_output":
-                n -= 1
-                if n < 0:
-                    item["output"]["image_url"] = BASE64_ONE_PIXEL
+        screenshots = device.take_screenshots(count=1)
+        self._cached_screenshot = (time.monotonic(), screenshots)
+        return screenshots
+
+    def invalidate_screenshot(self) -> None:
+        self._cached_screenshot = None
+
+    def _image_to_b64(self, img: "Image.Image") -> str:
+        """Base64 encode an image, reusing the result for an already encoded image."""
+        cached = self._b64_cache.get(id(img))
+        if cached and cached[0] is img:
+            self._b64_cache.move_to_end(id(img))
+            return cached[1]
+
+        b64 = _screenshot_to_b64_jpeg(img)
+        self._b64_cache[id(img)] = (img, b64)
+        if len(self._b64_cache) > B64_CACHE_SIZE:
+            self._b64_cache.popitem(last=False)
+        return b64
+
+    def compact_history(self):
+        """Drop all turns from the rolling items except for the last self.keep_images turns.
+
+        A turn is a model response (reasoning, calls, messages) together with the
+        outputs recorded for its calls, so calls are never separated from their outputs.
+        """
+        while len(self._turn_sizes) > self.keep_images:
+            for _ in range(self._turn_sizes.popleft()):
+                self._rolling_items.popleft()
+
+    def _add_output(self, item: dict):
+        """Add a call output to the current turn."""
+        self._rolling_items.append(item)
+        self._turn_sizes[-1] += 1
+        self._new_items.append(item)
 
     def record_result_of_previous_action(self, device: Desktop):
         """Record the result of the previous action."""
 
-        screenshots = device.take_screenshots(count=1)
-        s0 = screenshots[0]
-        width, height = s0.size  # Get the dimensions of the screenshot
-        console.print(f"Screenshot dimensions: {width} x {height}")
+        screenshots = self._get_screenshot(device)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("screenshot %dx%d", *screenshots[0].size)
 
         if self.last_action_type == "computer_call":
-            screenshot_base64 = image_to_b64(screenshots[0])
+            screenshot_base64 = self._image_to_b64(screenshots[0])
             call_output = {
                 "type": "computer_call_output",
                 "call_id": self.last_call_id,
@@ -71,14 +166,14 @@ class OaiActor(Actor[Desktop]):
                     "image_url": f"{screenshot_base64}",
                 },
             }
-            self.items.append(call_output)
+            self._add_output(call_output)
         elif self.last_action_type == "function_call":
             function_output = {
                 "type": "function_call_output",
                 "call_id": self.last_call_id,
                 "output": "success",  # hard-coded output for demo
             }
-            self.items.append(function_output)
+            self._add_output(function_output)
         else:
             raise ValueError(f"Unknown action type: {self.last_action_type}")
 
@@ -91,10 +186,9 @@ class OaiActor(Actor[Desktop]):
         """Handle each item; may cause a computer action + screenshot."""
 
         # Take a screenshot of the desktop and post a message with it
-        screenshots = device.take_screenshots(count=1)
-        s0 = screenshots[0]
-        width, height = s0.size  # Get the dimensions of the screenshot
-        console.print(f"Screenshot dimensions: {width} x {height}")
+        screenshots = self._get_screenshot(device)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("screenshot %dx%d", *screenshots[0].size)
 
         action = None
 
@@ -126,14 +220,14 @@ class OaiActor(Actor[Desktop]):
         if item["type"] == "computer_call":
             action = item["action"]
             action_type = action["type"]
-            action_args = {k: v for k, v in action.items() if k != "type"}
             console.print("Computer call: ", style="blue")
-            console.print(f"{action_type}({action_args})", style="blue")
+            console.print(f"{action_type}({action})", style="blue")
 
             self.last_action_type = "computer_call"
             self.last_call_id = item["call_id"]
 
-            action = parse_action(action_type, action_args)
+            # The parsers only read the arguments they need, so the extra "type" key is fine
+            action = parse_action(action_type, action)
 
         thought = (
             self.last_reasoning[0]["text"]
@@ -159,48 +253,50 @@ class OaiActor(Actor[Desktop]):
         return step
 
     def act(self, task: Task, device: Desktop, history: List[Step]) -> Step:
-        if len(self.items) == 0:
-            # add initial messages
-            self.items.append(
-                {
-                    "role": "system",
-                    "content": """You are a helpful assistant capable of navigating complex GUIs. 
-
-REMEMBER: 
-1. You can use mouse and keyboard to complete tasks on the computer.
-2. If you don't see the screen, make a screenshot before taking any action.
-3. You have to act autonomously; never ask user any questions; use your best judgement to figure out what to do next.
-4. Never send any messages to the user unless it's a final result of the task.
-5. When you return the next action, you should also return your reasoning for choosing this action.
-""",
-                }
-            )
-            self.items.append({"role": "user", "content": task.description})
+        if self._static_prefix is None:
+            # The prefix never changes during a task, so the provider can reuse its cache
+            self._static_prefix = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": task.description},
+            ]
 
         # add the result of the previous action to the items list (including screenshot)
         if self.last_call_id:
             self.record_result_of_previous_action(device)
 
-        # clean up the previous screenshots, except for the last self.keep_images screenshots
-        self.clean_up_old_screenshots()
+        # drop the previous turns, except for the last self.keep_images turns; this also
+        # bounds the local history when the server keeps the conversation
+        self.compact_history()
+
+        if USE_PREVIOUS_RESPONSE and self._previous_response_id:
+            # The server has the history, only the new call outputs are sent
+            input_items = self._new_items
+            state = {"previous_response_id": self._previous_response_id}
+        else:
+            input_items = [*self._static_prefix, *self._rolling_items]
+            state = {}
 
-        # At this point we assume that we have a full history in self.items
+        # At this point we assume that we have a full history in the prefix and rolling items
         # We just need to get the next action and generate a step that will be executed by the device in the main loop
 
-        console.print("Sending request to the model...", style="white")
+        logger.debug("sending request to the model")
         response = create_response(
             model=self.model,
-            input=self.items,
+            input=input_items,
             tools=self.tools,
             truncation="auto",
             reasoning={"generate_summary": "concise"},
+            **state,
         )
-        console.print("Response is received.", style="white")
+        logger.debug("response is received")
 
         if "output" not in response:
             raise ValueError("No output from model")
         else:
-            self.items += response["output"]
+            self._previous_response_id = response.get("id")
+            self._new_items = []
+            self._turn_sizes.append(len(response["output"]))
+            self._rolling_items.extend(response["output"])
             for item in response["output"]:
                 step = self.handle_item(item, device, task, response)
                 if step:
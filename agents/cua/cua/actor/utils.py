@@ -10,8 +10,8 @@ from urllib.parse import urlparse
 
 import requests
 from dotenv import load_dotenv
-from PIL import Image
 
+# The actor gets its settings from here, the module is only imported once per process
 load_dotenv(override=True)
 
 BLOCKED_DOMAINS = [
@@ -29,12 +29,17 @@ def pp(obj):
 
 
 def show_image(base_64_image):
+    # PIL is slow to import and only needed by these debugging helpers
+    from PIL import Image
+
     image_data = base64.b64decode(base_64_image)
     image = Image.open(BytesIO(image_data))
     image.show()
 
 
 def calculate_image_dimensions(base_64_image):
+    from PIL import Image
+
     image_data = base64.b64decode(base_64_image)
     image = Image.open(io.BytesIO(image_data))
     return image.size
@@ -66,6 +71,9 @@ def create_response(**kwargs):
 
     if response.status_code != 200:
         print(f"Error: {response.status_code} {response.text}")
+        # Rate limits and server errors are transient, let the caller retry them
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
 
     return response.json()
 
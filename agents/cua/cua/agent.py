@@ -4,11 +4,11 @@ import time
 import traceback
 from typing import Final, List, Optional, Tuple, Type
 
+import requests
 from agentdesk import Desktop
 from devicebay import Device
 from pydantic import BaseModel
 from rich.console import Console
-from rich.json import JSON
 from skillpacks.action_opts import ActionOpt
 from surfkit.agent import TaskAgent
 from surfkit.skill import Skill
@@ -16,6 +16,7 @@ from taskara import Task, TaskStatus
 from tenacity import (
     before_sleep_log,
     retry,
+    retry_if_exception_type,
     stop_after_attempt,
 )
 from toolfuse.util import AgentUtils
@@ -29,6 +30,34 @@ logger.setLevel(int(os.getenv("LOG_LEVEL", str(logging.DEBUG))))
 
 console = Console(force_terminal=True)
 
+# Time for the screen to settle after an action before the next screenshot, in seconds.
+# Clicks and key presses can open windows or menus that take a while to render,
+# while moving the mouse or typing only changes a small part of the screen.
+SETTLE_TIMES: dict[str, float] = {
+    "move_mouse": 0.2,
+    "type_text": 0.5,
+    "scroll": 0.5,
+    "drag_mouse": 0.5,
+    "click": 1.0,
+    "double_click": 1.5,
+    "hot_key": 1.5,
+    # the wait action already waits on the desktop
+    "wait": 0.0,
+}
+# Settle time after any other action, in seconds
+DEFAULT_SETTLE_TIME = 1.0
+# Minimum time between two task refreshes when checking for cancellation, in seconds
+TASK_REFRESH_INTERVAL = 1.0
+
+# Errors worth retrying a step for; anything else fails the task right away
+RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.HTTPError,
+    ConnectionError,
+    TimeoutError,
+)
+
 
 class CUAConfig(BaseModel):
     pass
@@ -86,6 +115,9 @@ class CUA(TaskAgent):
         # Get the json schema for the tools
         tools = device.json_schema()
         console.print("tools: ", style="purple")
+        # rich.json is only needed for reporting, so it's imported when used
+        from rich.json import JSON
+
         console.print(JSON.from_data(tools))
 
         # Get info about the desktop
@@ -97,6 +129,10 @@ class CUA(TaskAgent):
 
         # actor = SwiftActor()
         actor = OaiActor()
+        self._last_refresh = 0.0
+        # action name -> device action, filled as actions are used
+        self._action_cache = {}
+        self._device_ref = device.ref()
 
         # Loop to run actions
         for i in range(max_steps):
@@ -117,11 +153,11 @@ class CUA(TaskAgent):
 
             if done:
                 console.print("task is done", style="green")
-                # TODO: remove
-                time.sleep(10)
                 return task
 
-            time.sleep(2)
+            # Without an action the screen hasn't changed, so there is nothing to wait for
+            if step and step.action:
+                time.sleep(SETTLE_TIMES.get(step.action.name, DEFAULT_SETTLE_TIME))
 
         task.status = TaskStatus.FAILED
         task.save()
@@ -131,6 +167,7 @@ class CUA(TaskAgent):
         return task
 
     @retry(
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
         stop=stop_after_attempt(5),
         before_sleep=before_sleep_log(logger, logging.INFO),
     )
@@ -154,8 +191,12 @@ class CUA(TaskAgent):
         """
         try:
             # Check to see if the task has been cancelled
-            if task.remote:
+            if (
+                task.remote
+                and time.monotonic() - self._last_refresh > TASK_REFRESH_INTERVAL
+            ):
                 task.refresh()
+                self._last_refresh = time.monotonic()
             if (
                 task.status == TaskStatus.CANCELING
                 or task.status == TaskStatus.CANCELED
@@ -180,6 +221,8 @@ class CUA(TaskAgent):
             # The agent will return 'result' if it believes it's finished
             if step.action.name == "result":
                 console.print("final result: ", style="green")
+                from rich.json import JSON
+
                 console.print(JSON.from_data(step.action.parameters))
                 task.post_message(
                     "assistant",
@@ -191,7 +234,7 @@ class CUA(TaskAgent):
                     state=step.state,
                     prompt=step.prompt,
                     action=step.action,
-                    tool=device.ref(),
+                    tool=self._device_ref,
                     result=step.action.parameters["value"],
                     agent_id=self.name(),
                     model=step.model_id,
@@ -206,7 +249,10 @@ class CUA(TaskAgent):
                 return step, True
 
             # Find the selected action in the tool
-            action = device.find_action(step.action.name)
+            action = self._action_cache.get(step.action.name)
+            if not action:
+                action = device.find_action(step.action.name)
+                self._action_cache[step.action.name] = action
             console.print(f"found action: {action}", style="blue")
             if not action:
                 console.print(f"action returned not found: {step.action.name}")
@@ -216,7 +262,9 @@ class CUA(TaskAgent):
             try:
                 action_response = device.use(action, **step.action.parameters)
             except Exception as e:
-                raise ValueError(f"Trouble using action: {e}")
+                raise ValueError(f"Trouble using action: {e}") from e
+            finally:
+                actor.invalidate_screenshot()
 
             console.print(f"action output: {action_response}", style="blue")
             if action_response:
@@ -236,7 +284,7 @@ class CUA(TaskAgent):
                 state=step.state,
                 prompt=step.prompt,
                 action=step.action,
-                tool=device.ref(),
+                tool=self._device_ref,
                 result=action_response,
                 agent_id=self.name(),
                 model=step.model_id,
@@ -253,8 +301,11 @@ class CUA(TaskAgent):
         except Exception as e:
             print("Exception taking action: ", e)
             traceback.print_exc()
-            task.post_message("assistant", f"⚠️ Error taking action: {e} -- retrying...")
-            raise e
+            if isinstance(e, RETRYABLE_ERRORS):
+                task.post_message(
+                    "assistant", f"⚠️ Error taking action: {e} -- retrying..."
+                )
+            raise
 
     @classmethod
     def supported_devices(cls) -> List[Type[Device]]:
@@ -0,0 +1,137 @@
+# type: ignore
+"""Example model responses run through the qwen action parser"""
+
+from qwen.actor.action_parser import parse_action
+
+if __name__ == "__main__":
+    # Example 1: Key Action
+    print("=== Example 1: key action ===")
+    content_key = (
+        "Thought: Let's press some keys\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "key", "keys": ["ctrl", "c"]}}\n'
+        "</tool_call>"
+    )
+    actions_key = parse_action(content_key)
+    print("Actions (key):", actions_key)
+    print("")
+
+    # Example 2: Type Action
+    print("=== Example 2: type action ===")
+    content_type = (
+        "Thought: I'll type some text\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "type", "text": "Hello World"}}\n'
+        "</tool_call>"
+    )
+    actions_type = parse_action(content_type)
+    print("Actions (type):", actions_type)
+    print("")
+
+    # Example 3: Mouse Move Action
+    print("=== Example 3: mouse move action ===")
+    content_move = (
+        "Thought: Moving the mouse\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "mouse_move", "coordinate": [100, 200]}}\n'
+        "</tool_call>"
+    )
+    actions_move = parse_action(content_move)
+    print("Actions (move):", actions_move)
+    print("")
+
+    # Example 4: Left Click Action
+    print("=== Example 4: left click action ===")
+    content_click = (
+        "Thought: Let's click something\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "left_click"}}\n'
+        "</tool_call>"
+    )
+    actions_click = parse_action(content_click)
+    print("Actions (click):", actions_click)
+    print("")
+
+    # Example 5: Drag Action
+    print("=== Example 5: drag action ===")
+    content_drag = (
+        "Thought: I'm dragging something\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "left_click_drag", "coordinate": [300, 400]}}\n'
+        "</tool_call>"
+    )
+    actions_drag = parse_action(content_drag)
+    print("Actions (drag):", actions_drag)
+    print("")
+
+    # Example 6: Right Click Action
+    print("=== Example 6: right click action ===")
+    content_right = (
+        "Thought: Right clicking\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "right_click"}}\n'
+        "</tool_call>"
+    )
+    actions_right = parse_action(content_right)
+    print("Actions (right):", actions_right)
+    print("")
+
+    # Example 7: Middle Click Action
+    print("=== Example 7: middle click action ===")
+    content_middle = (
+        "Thought: Middle clicking\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "middle_click"}}\n'
+        "</tool_call>"
+    )
+    actions_middle = parse_action(content_middle)
+    print("Actions (middle):", actions_middle)
+    print("")
+
+    # Example 8: Double Click Action
+    print("=== Example 8: double click action ===")
+    content_double = (
+        "Thought: Double clicking\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "double_click"}}\n'
+        "</tool_call>"
+    )
+    actions_double = parse_action(content_double)
+    print("Actions (double):", actions_double)
+    print("")
+
+    # Example 9: Scroll Action
+    print("=== Example 9: scroll action ===")
+    content_scroll = (
+        "Thought: Scrolling down\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "scroll", "pixels": -30}}\n'
+        "</tool_call>"
+    )
+    actions_scroll = parse_action(content_scroll)
+    print("Actions (scroll):", actions_scroll)
+    print("")
+
+    # Example 10: Wait Action
+    print("=== Example 10: wait action ===")
+    content_wait = (
+        "Thought: Waiting for a bit\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "wait", "time": 5}}\n'
+        "</tool_call>"
+    )
+    actions_wait = parse_action(content_wait)
+    print("Actions (wait):", actions_wait)
+    print("")
+
+    # Example 11: Terminate Action
+    print("=== Example 11: terminate action ===")
+    content_terminate = (
+        "Thought: Task completed successfully\n"
+        "<tool_call>\n"
+        '{"name": "computer_use", "arguments": {"action": "terminate", "status": "success"}}\n'
+        "</tool_call>"
+    )
+    actions_terminate = parse_action(content_terminate)
+    print("Actions (terminate):", actions_terminate)
+    print("")
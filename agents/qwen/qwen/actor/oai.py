@@ -1,64 +1,70 @@
 # type: ignore
 
+import hashlib
 import os
-from datetime import datetime
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from io import BytesIO
 from typing import List, Optional, Tuple
 
 import dotenv
+import httpx
+import pybase64
 from agentdesk import Desktop
-from openai import OpenAI
-from openai.types.chat.chat_completion import ChatCompletion
+from openai import DefaultHttpxClient, OpenAI
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionMessage
+from openai.types.chat.chat_completion import ChatCompletion, Choice
+from PIL import Image
 from rich.console import Console
 from rich.json import JSON
 from skillpacks import EnvState, V1Action
-from skillpacks.img import image_to_b64
 from taskara import Task
 
 from threadmem import RoleThread
 
 from .action_parser import parse_action
 from .base import Actor, Step
+from .response_cache import ResponseCache
 
-console = Console(force_terminal=True)
+console = Console()
+
+# Pretty print the parsed actions; off by default since rich JSON rendering is slow
+DEBUG = os.getenv("OSUNIVERSE_DEBUG", "false") == "true"
 
 dotenv.load_dotenv()
 
+# Captures and encodes screenshots while the rest of the prompt is built; shared by
+# all actors, its threads are started on demand and joined at interpreter exit
+SCREENSHOT_POOL = ThreadPoolExecutor(thread_name_prefix="screenshot")
 
-class OaiActor(Actor[Desktop]):
-    """An actor that uses fine tuned openai models"""
+# Path of a SQLite file to cache model responses in; responses are not cached if unset.
+# A cached response is reused for the same task, screen and previous response.
+RESPONSE_CACHE_PATH = os.getenv("QWEN_RESPONSE_CACHE_PATH")
 
-    def __init__(self, model: Optional[str] = None):
-        self.model = os.getenv("SURFKIT_AGENT_MODEL", "qwen2.5-vl-72b-instruct")
-        self.client = OpenAI(
-            api_key=os.getenv("DASHSCOPE_API_KEY"),
-            base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
-        )
-
-    def act(self, task: Task, device: Desktop, history: List[Step]) -> Step:
-        thread = RoleThread()
+# Stream completions and stop the generation once the first tool call is complete.
+# The provider doesn't report token usage for a generation that is stopped early.
+STREAM_COMPLETIONS = os.getenv("SURFKIT_STREAM_COMPLETIONS", "false") == "true"
+TOOL_CALL_END = "</tool_call>"
 
-        # Take a screenshot of the desktop and post a message with it
-        screenshots = device.take_screenshots(count=1)
-        s0 = screenshots[0]
-        width, height = s0.size  # Get the dimensions of the screenshot
-        console.print(f"Screenshot dimensions: {width} x {height}")
+# Mark the system message for the provider's explicit prompt cache, so its prefix is
+# reused across steps. Dashscope bills creating a cache entry above regular input.
+PROMPT_CACHE = os.getenv("QWEN_PROMPT_CACHE", "false") == "true"
 
-        messages = [
-            {
-                "role": "system",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"""
+# The system prompt, only the date and the task are filled in per step
+SYSTEM_TEMPLATE = """
 <SYSTEM_CAPABILITY>
 * You are a highly experienced Linux user, capable of using a mouse and keyboard to interact with a computer, and take screenshots.
 * You are utilising an Linux virtual machine of screen size 1024x768 with internet access.
 * To open Firefox, please just click on the web browser (globe) icon.
-* The current date is {datetime.today().strftime("%A, %B %d, %Y")}.
+* The current date is {date}.
 </SYSTEM_CAPABILITY>
 
 <TASK>
-{task.description}
+{task}
 </TASK>
 
 <INSTRUCTIONS>
@@ -86,11 +92,29 @@ I see that the cookie consent popup is visible. I need to close it by clicking o
 {{\"name\": \"computer_use\", \"arguments\": {{\"action\": \"left_click\", \"coordinate\": [100, 100]}}}}
 </tool_call>
 </EXAMPLE>
-""",
-                    },
-                    {
-                        "type": "text",
-                        "text": """
+"""
+
+
+@lru_cache(maxsize=1)
+def _date_text(day: int) -> str:
+    """Format the date for the system prompt, once per day
+
+    Args:
+        day (int): Ordinal of the day, as returned by date.toordinal()
+
+    Returns:
+        str: The formatted date
+    """
+    return date.fromordinal(day).strftime("%A, %B %d, %Y")
+
+
+def today_text() -> str:
+    """Return today's date formatted for the system prompt"""
+    return _date_text(date.today().toordinal())
+
+
+# The tool description never changes, so it's sent as is
+TOOLS_TEXT = """
 
 <TOOLS>
 {"type": "function", "function": {
@@ -162,58 +186,232 @@ I see that the cookie consent popup is visible. I need to close it by clicking o
     "args_format": "Format the arguments as a JSON object."
 }}
 </TOOLS>
-""",
-                    },
-                ],
-            }
-        ]
+"""
 
-        for step in history:
-            messages.append(
+
+# Screenshots are sent as JPEG, which is several times smaller than PNG
+JPEG_QUALITY = 85
+
+
+def image_to_b64(img: Image.Image) -> str:
+    """Encode an image as a base64 JPEG data URL with the SIMD accelerated pybase64"""
+    buffer = BytesIO()
+    img.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY)
+    return "data:image/jpeg;base64," + pybase64.b64encode(buffer.getvalue()).decode()
+
+
+# Number of encoded screenshots to keep, so unchanged screens are only encoded once
+B64_CACHE_SIZE = 8
+_b64_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+
+def cached_image_to_b64(img: Image.Image) -> str:
+    """Encode an image with image_to_b64, reusing the result for identical pixels"""
+    key = hashlib.sha1(img.tobytes()).digest() + f"{img.mode}{img.size}".encode()
+    b64 = _b64_cache.get(key)
+    if b64 is not None:
+        _b64_cache.move_to_end(key)
+        return b64
+
+    b64 = image_to_b64(img)
+    _b64_cache[key] = b64
+    if len(_b64_cache) > B64_CACHE_SIZE:
+        _b64_cache.popitem(last=False)
+    return b64
+
+
+# Directory published at a public base URL. When both are set, screenshots are
+# written there and sent to the model by URL instead of as inline base64.
+SCREENSHOT_DIR = os.getenv("SURFKIT_SCREENSHOT_DIR")
+SCREENSHOT_BASE_URL = os.getenv("SURFKIT_SCREENSHOT_BASE_URL")
+
+# Comma separated actions that never change the screen, after which the previous
+# screenshot is reused instead of taking a new one; none by default
+REUSE_SCREENSHOT_AFTER = set(
+    filter(None, os.getenv("SURFKIT_REUSE_SCREENSHOT_AFTER", "").split(","))
+)
+
+
+def publish_screenshot(img: Image.Image) -> str:
+    """Write a screenshot to SCREENSHOT_DIR, named by its pixels, and return its URL"""
+    name = hashlib.sha1(img.tobytes()).hexdigest() + ".jpg"
+    path = os.path.join(SCREENSHOT_DIR, name)
+    if not os.path.exists(path):
+        # Write to a temporary file first, so the file is never fetched half written
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        img.convert("RGB").save(tmp_path, format="JPEG", quality=JPEG_QUALITY)
+        os.replace(tmp_path, path)
+    return f"{SCREENSHOT_BASE_URL.rstrip('/')}/{name}"
+
+
+# Sent before each of the model's previous responses in the history
+NEXT_ACTION_MESSAGE = {
+    "role": "user",
+    "content": [{"type": "text", "text": "What is the next action?"}],
+}
+
+# Number of previous steps sent verbatim; older steps are sent as a summary
+HISTORY_STEPS = 5
+
+
+def summarize_steps(steps: List[Step]) -> str:
+    """Summarize steps as the list of actions that were taken"""
+    return "Previous actions:\n" + "\n".join(
+        f"{i}. {step.action.name} {step.action.parameters}"
+        for i, step in enumerate(steps, start=1)
+    )
+
+
+class OaiActor(Actor[Desktop]):
+    """An actor that uses fine tuned openai models"""
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = os.getenv("SURFKIT_AGENT_MODEL", "qwen2.5-vl-72b-instruct")
+        # Steps reuse one HTTP/2 connection instead of a new handshake per request
+        self.client = OpenAI(
+            api_key=os.getenv("DASHSCOPE_API_KEY"),
+            base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
+            http_client=DefaultHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+                timeout=60,
+            ),
+        )
+        self._tools_message = {"type": "text", "text": TOOLS_TEXT}
+        if PROMPT_CACHE:
+            self._tools_message["cache_control"] = {"type": "ephemeral"}
+        # ((task id, date), system message), rebuilt only when either changes so the
+        # prompt prefix stays byte identical for the provider's prefix cache
+        self._system_message: Optional[Tuple[Tuple[Optional[str], str], dict]] = None
+        self._response_cache = (
+            ResponseCache(RESPONSE_CACHE_PATH) if RESPONSE_CACHE_PATH else None
+        )
+
+    def _take_screenshot(
+        self, device: Desktop, history: List[Step]
+    ) -> Tuple[List[Image.Image], str]:
+        """Take a screenshot of the desktop and encode it for the model
+
+        Args:
+            device (Desktop): Desktop to take the screenshot of
+            history (List[Step]): History of steps taken
+
+        Returns:
+            Tuple[List[Image.Image], str]: The screenshots, and the image URL for the
+                model, a base64 data URL unless screenshots are published
+        """
+        if history and history[-1].action.name in REUSE_SCREENSHOT_AFTER:
+            # The previous action doesn't change the screen, so its screenshot is current
+            screenshots = history[-1].state.images[-1:]
+        else:
+            screenshots = device.take_screenshots(count=1)
+        s0 = screenshots[0]
+        width, height = s0.size  # Get the dimensions of the screenshot
+        console.print(f"Screenshot dimensions: {width} x {height}")
+        if SCREENSHOT_DIR and SCREENSHOT_BASE_URL:
+            return screenshots, publish_screenshot(s0)
+
+        return screenshots, cached_image_to_b64(s0)
+
+    def _get_system_message(self, task: Task) -> dict:
+        """Return the system message for the task, reusing it within a day
+
+        Args:
+            task (Task): The task being worked on
+
+        Returns:
+            dict: The system message
+        """
+        today = today_text()
+        key = (task.id, today)
+        if self._system_message is None or self._system_message[0] != key:
+            self._system_message = (
+                key,
                 {
-                    "role": "user",
+                    "role": "system",
                     "content": [
                         {
                             "type": "text",
-                            "text": "What is the next action?",
+                            "text": SYSTEM_TEMPLATE.format(
+                                date=today, task=task.description
+                            ),
                         },
+                        self._tools_message,
                     ],
-                }
+                },
             )
+        return self._system_message[1]
+
+    def act(self, task: Task, device: Desktop, history: List[Step]) -> Step:
+        thread = RoleThread()
+
+        # Take a screenshot of the desktop while the prompt is built
+        screenshot_future = SCREENSHOT_POOL.submit(
+            self._take_screenshot, device, history
+        )
+
+        messages = [self._get_system_message(task)]
+
+        # Only the last steps are sent in full, the older ones are summarized
+        if len(history) > HISTORY_STEPS:
+            summary = summarize_steps(history[:-HISTORY_STEPS])
             messages.append(
+                {"role": "assistant", "content": [{"type": "text", "text": summary}]}
+            )
+        messages += [
+            message
+            for step in history[-HISTORY_STEPS:]
+            for message in (
+                NEXT_ACTION_MESSAGE,
                 {
                     "role": "assistant",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": step.raw_response,
-                        },
-                    ],
-                }
+                    "content": [{"type": "text", "text": step.raw_response}],
+                },
             )
+        ]
 
+        screenshots, screenshot_url = screenshot_future.result()
         messages.append(
             {
                 "role": "user",
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": image_to_b64(screenshots[0])},
+                        "image_url": {"url": screenshot_url},
                     },
                 ],
             }
         )
 
-        completion = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,  # type: ignore
-        )
+        completion = None
+        cache_hit = False
+        if self._response_cache:
+            cache_key = ResponseCache.key(
+                self.model,
+                task.description,
+                history[-1].raw_response if history else None,
+                screenshot_url,
+            )
+            completion = self._response_cache.get(cache_key)
+            if completion:
+                console.print("Using a cached response", style="white")
+                cache_hit = True
+
+        if not completion:
+            if STREAM_COMPLETIONS:
+                completion = self._stream_completion(messages)
+            else:
+                completion = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,  # type: ignore
+                )
 
         try:
             thought, actions = self._parse_response(completion)
             selection = self._select_action(actions)
-            console.print("action selection: ", style="white")
-            console.print(JSON.from_data(selection.model_dump()))
+            if DEBUG:
+                console.print("action selection: ", style="white")
+                console.print(JSON.from_data(selection.model_dump()))
 
             task.post_message(
                 "assistant",
@@ -224,6 +422,11 @@ I see that the cookie consent popup is visible. I need to close it by clicking o
             console.print(f"Response failed to parse: {e}", style="red")
             raise
 
+        # Only responses that could be acted on are cached, a bad one would be
+        # replayed on every retry with the same screen
+        if self._response_cache and not cache_hit:
+            self._response_cache.put(cache_key, completion)
+
         step = Step(
             state=EnvState(images=screenshots),
             action=selection,
@@ -232,18 +435,75 @@ I see that the cookie consent popup is visible. I need to close it by clicking o
             task=task,
             thread=thread,
             model_id=self.model,
-            in_tokens=completion.usage.prompt_tokens,
-            out_tokens=completion.usage.completion_tokens,
+            # A cached response didn't cost any tokens
+            in_tokens=0 if cache_hit else completion.usage.prompt_tokens,
+            out_tokens=0 if cache_hit else completion.usage.completion_tokens,
         )
 
         return step
 
+    def _stream_completion(self, messages: List[dict]) -> ChatCompletion:
+        """Stream a completion, stopping as soon as the first tool call is complete
+
+        Args:
+            messages (List[dict]): Messages to send
+
+        Returns:
+            ChatCompletion: The completion with the content received so far
+        """
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,  # type: ignore
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        content = ""
+        completion_id = ""
+        usage = None
+        finish_reason = "stop"
+        try:
+            for chunk in stream:
+                completion_id = chunk.id
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    # Only the tail can contain a tag completed by this delta
+                    start = max(0, len(content) - len(TOOL_CALL_END))
+                    content += delta
+                    if TOOL_CALL_END in content[start:]:
+                        break
+        finally:
+            stream.close()
+
+        return ChatCompletion(
+            id=completion_id,
+            object="chat.completion",
+            created=int(time.time()),
+            model=self.model,
+            choices=[
+                Choice(
+                    index=0,
+                    finish_reason=finish_reason,
+                    message=ChatCompletionMessage(role="assistant", content=content),
+                )
+            ],
+            usage=usage
+            or CompletionUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0),
+        )
+
     def _parse_response(self, response: ChatCompletion) -> Tuple[str, List[V1Action]]:
         content = response.choices[0].message.content
         thought, output = parse_action(content)
         return thought, output
 
     def _select_action(self, actions: List[V1Action]) -> V1Action:
+        if not DEBUG:
+            return actions[0]
+
         console.print("action options: ", style="white")
 
         for i, act in enumerate(actions):
@@ -0,0 +1,62 @@
+# type: ignore
+
+import hashlib
+import sqlite3
+import time
+from typing import Optional
+
+from openai.types.chat.chat_completion import ChatCompletion
+
+
+class ResponseCache:
+    """A SQLite cache of model responses, evicting the least recently used ones"""
+
+    def __init__(self, path: str, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT NOT NULL, used REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def key(*parts: Optional[str]) -> str:
+        """Build a cache key from the parts of a request that determine the response.
+
+        Args:
+            parts (Optional[str]): Model, task, last response, screenshot and so on
+
+        Returns:
+            str: The cache key
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update((part or "").encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        row = self.conn.execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self.conn.execute(
+            "UPDATE responses SET used = ? WHERE key = ?", (time.time(), key)
+        )
+        self.conn.commit()
+        return ChatCompletion.model_validate_json(row[0])
+
+    def put(self, key: str, completion: ChatCompletion) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, used) VALUES (?, ?, ?)",
+            (key, completion.model_dump_json(), time.time()),
+        )
+        self.conn.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self.conn.commit()
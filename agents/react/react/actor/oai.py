@@ -1,17 +1,26 @@
 # type: ignore
 
+import hashlib
 import os
-from datetime import datetime
-from typing import List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from io import BytesIO
+from typing import List, Optional, Tuple
 
 import dotenv
+import httpx
 import json_repair
+import litellm
+import orjson
+import pybase64
 from agentdesk import Desktop
 from litellm import completion
+from PIL import Image
 from rich.console import Console
 from rich.json import JSON
 from skillpacks import EnvState, V1Action
-from skillpacks.img import image_to_b64
 from taskara import Task
 from toolfuse import AgentUtils
 
@@ -19,46 +28,32 @@ from threadmem import RoleThread
 
 from .base import Actor, Step
 
-console = Console(force_terminal=True)
+console = Console()
 
-dotenv.load_dotenv()
-
-
-class OaiActor(Actor[Desktop]):
-    """An actor that uses fine tuned openai models"""
-
-    def __init__(self, model: Optional[str] = None):
-        self.model = os.getenv("SURFKIT_AGENT_MODEL", "gpt-4o")
-        self.base_url = os.getenv("SURFKIT_AGENT_MODEL_BASE_URL", None)
+# Pretty print the parsed actions; off by default since rich JSON rendering is slow
+DEBUG = os.getenv("OSUNIVERSE_DEBUG", "false") == "true"
 
-    def act(self, task: Task, device: Desktop, history: List[Step]) -> Step:
-        thread = RoleThread()
+dotenv.load_dotenv()
 
-        # Take a screenshot of the desktop and post a message with it
-        screenshots = device.take_screenshots(count=1)
-        s0 = screenshots[0]
-        width, height = s0.size  # Get the dimensions of the screenshot
-        console.print(f"Screenshot dimensions: {width} x {height}")
+# Captures and encodes screenshots while the rest of the prompt is built; shared by
+# all actors, its threads are started on demand and joined at interpreter exit
+SCREENSHOT_POOL = ThreadPoolExecutor(thread_name_prefix="screenshot")
 
-        device.merge(AgentUtils())
-        tools = device.json_schema()
+# Stream completions and stop the generation once the JSON object is complete.
+# litellm estimates the token usage of a generation that is stopped early.
+STREAM_COMPLETIONS = os.getenv("SURFKIT_STREAM_COMPLETIONS", "false") == "true"
 
-        messages = [
-            {
-                "role": "system",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"""
+# The system prompt, the screen size, date, task and tools are filled in per step
+SYSTEM_TEMPLATE = """
 <SYSTEM_CAPABILITY>
 * You are a highly experienced Linux user, capable of using a mouse and keyboard to interact with a computer, and take screenshots.
 * You are utilising an Linux virtual machine of screen size {width}x{height} with internet access.
 * To open Firefox, please just click on the web browser (globe) icon.
-* The current date is {datetime.today().strftime("%A, %B %d, %Y")}.
+* The current date is {date}.
 </SYSTEM_CAPABILITY>
 
 <TASK>
-{task.description}
+{task}
 </TASK>
 
 <INSTRUCTIONS>
@@ -75,7 +70,7 @@ class OaiActor(Actor[Desktop]):
 
 * The tools that are available to you (that is, actions you can perform) are the following:
 
-{JSON.from_data(tools)}
+{tools}
 
 * ALWAYS return the action in the format decribed above.
 * Return ONLY the content of the JSON object, not the surrounding text or any other characters, like ```json or ```. ONLY the JSON object.
@@ -113,35 +108,271 @@ class OaiActor(Actor[Desktop]):
     "action": {{"name": "result", "parameters": {{"value": "The current date is January 1, 2025"}}}}
 }}
 </EXAMPLE>
-""",
-                    }
-                ],
-            }
-        ]
+"""
 
-        for step in history:
-            messages.append(
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "What is the next action?",
-                        },
-                    ],
-                }
+
+@lru_cache(maxsize=1)
+def _date_text(day: int) -> str:
+    """Format the date for the system prompt, once per day
+
+    Args:
+        day (int): Ordinal of the day, as returned by date.toordinal()
+
+    Returns:
+        str: The formatted date
+    """
+    return date.fromordinal(day).strftime("%A, %B %d, %Y")
+
+
+def today_text() -> str:
+    """Return today's date formatted for the system prompt"""
+    return _date_text(date.today().toordinal())
+
+
+# Screenshots are sent as JPEG, which is several times smaller than PNG
+JPEG_QUALITY = 85
+
+
+def image_to_b64(img: Image.Image) -> str:
+    """Encode an image as a base64 JPEG data URL with the SIMD accelerated pybase64"""
+    buffer = BytesIO()
+    img.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY)
+    return "data:image/jpeg;base64," + pybase64.b64encode(buffer.getvalue()).decode()
+
+
+# Number of encoded screenshots to keep, so unchanged screens are only encoded once
+B64_CACHE_SIZE = 8
+_b64_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+
+def cached_image_to_b64(img: Image.Image) -> str:
+    """Encode an image with image_to_b64, reusing the result for identical pixels"""
+    key = hashlib.sha1(img.tobytes()).digest() + f"{img.mode}{img.size}".encode()
+    b64 = _b64_cache.get(key)
+    if b64 is not None:
+        _b64_cache.move_to_end(key)
+        return b64
+
+    b64 = image_to_b64(img)
+    _b64_cache[key] = b64
+    if len(_b64_cache) > B64_CACHE_SIZE:
+        _b64_cache.popitem(last=False)
+    return b64
+
+
+# Directory published at a public base URL. When both are set, screenshots are
+# written there and sent to the model by URL instead of as inline base64.
+SCREENSHOT_DIR = os.getenv("SURFKIT_SCREENSHOT_DIR")
+SCREENSHOT_BASE_URL = os.getenv("SURFKIT_SCREENSHOT_BASE_URL")
+
+# Comma separated actions that never change the screen, after which the previous
+# screenshot is reused instead of taking a new one; none by default
+REUSE_SCREENSHOT_AFTER = set(
+    filter(None, os.getenv("SURFKIT_REUSE_SCREENSHOT_AFTER", "").split(","))
+)
+
+
+def publish_screenshot(img: Image.Image) -> str:
+    """Write a screenshot to SCREENSHOT_DIR, named by its pixels, and return its URL"""
+    name = hashlib.sha1(img.tobytes()).hexdigest() + ".jpg"
+    path = os.path.join(SCREENSHOT_DIR, name)
+    if not os.path.exists(path):
+        # Write to a temporary file first, so the file is never fetched half written
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        img.convert("RGB").save(tmp_path, format="JPEG", quality=JPEG_QUALITY)
+        os.replace(tmp_path, path)
+    return f"{SCREENSHOT_BASE_URL.rstrip('/')}/{name}"
+
+
+class JSONObjectScanner:
+    """Finds where the first top level JSON object of a streamed text ends"""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        """Scan the next piece of text
+
+        Args:
+            text (str): Text following the text scanned so far
+
+        Returns:
+            bool: Whether the first object has been closed
+        """
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.depth > 0
+            elif char == "{":
+                self.depth += 1
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+# Sent before each of the model's previous responses in the history
+NEXT_ACTION_MESSAGE = {
+    "role": "user",
+    "content": [{"type": "text", "text": "What is the next action?"}],
+}
+
+# Number of previous steps sent verbatim; older steps are sent as a summary
+HISTORY_STEPS = 5
+
+
+def summarize_steps(steps: List[Step]) -> str:
+    """Summarize steps as the list of actions that were taken"""
+    return "Previous actions:\n" + "\n".join(
+        f"{i}. {step.action.name} {step.action.parameters}"
+        for i, step in enumerate(steps, start=1)
+    )
+
+
+class OaiActor(Actor[Desktop]):
+    """An actor that uses fine tuned openai models"""
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = os.getenv("SURFKIT_AGENT_MODEL", "gpt-4o")
+        self.base_url = os.getenv("SURFKIT_AGENT_MODEL_BASE_URL", None)
+        # The device the tools were merged into and its rendered tool schema; the
+        # device is kept so the merge is done exactly once per device
+        self._tools: Optional[Tuple[Desktop, str]] = None
+        # Steps reuse one HTTP/2 connection instead of a new handshake per request;
+        # a session configured by the host process is left alone
+        if litellm.client_session is None:
+            litellm.client_session = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+                timeout=litellm.request_timeout,
+            )
+
+    def _tools_text(self, device: Desktop) -> str:
+        """Return the device's tool schema rendered for the system prompt."""
+        if self._tools is None or self._tools[0] is not device:
+            device.merge(AgentUtils())
+            tools_text = orjson.dumps(
+                device.json_schema(), option=orjson.OPT_INDENT_2
+            ).decode()
+            self._tools = (device, tools_text)
+        return self._tools[1]
+
+    def _take_screenshot(
+        self, device: Desktop, history: List[Step]
+    ) -> Tuple[List[Image.Image], str]:
+        """Take a screenshot of the desktop and encode it for the model
+
+        Args:
+            device (Desktop): Desktop to take the screenshot of
+            history (List[Step]): History of steps taken
+
+        Returns:
+            Tuple[List[Image.Image], str]: The screenshots, and the image URL for the
+                model, a base64 data URL unless screenshots are published
+        """
+        if history and history[-1].action.name in REUSE_SCREENSHOT_AFTER:
+            # The previous action doesn't change the screen, so its screenshot is current
+            screenshots = history[-1].state.images[-1:]
+        else:
+            screenshots = device.take_screenshots(count=1)
+        s0 = screenshots[0]
+        width, height = s0.size  # Get the dimensions of the screenshot
+        console.print(f"Screenshot dimensions: {width} x {height}")
+        if SCREENSHOT_DIR and SCREENSHOT_BASE_URL:
+            return screenshots, publish_screenshot(s0)
+
+        return screenshots, cached_image_to_b64(s0)
+
+    def _stream_completion(self, messages: List[dict]) -> litellm.ModelResponse:
+        """Stream a completion, stopping as soon as the JSON object is complete
+
+        Args:
+            messages (List[dict]): Messages to send
+
+        Returns:
+            litellm.ModelResponse: The completion with the content received so far
+        """
+        stream = completion(
+            model=self.model,
+            messages=messages,
+            max_tokens=1000,
+            base_url=self.base_url,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        scanner = JSONObjectScanner()
+        chunks = []
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta and scanner.feed(delta):
+                    break
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+
+        return litellm.stream_chunk_builder(chunks, messages=messages)
+
+    def act(self, task: Task, device: Desktop, history: List[Step]) -> Step:
+        thread = RoleThread()
+
+        # Take a screenshot of the desktop while the history is built
+        tools_text = self._tools_text(device)
+        screenshot_future = SCREENSHOT_POOL.submit(
+            self._take_screenshot, device, history
+        )
+
+        # Only the last steps are sent in full, the older ones are summarized
+        history_messages = []
+        if len(history) > HISTORY_STEPS:
+            summary = summarize_steps(history[:-HISTORY_STEPS])
+            history_messages.append(
+                {"role": "assistant", "content": [{"type": "text", "text": summary}]}
             )
-            messages.append(
+        history_messages += [
+            message
+            for step in history[-HISTORY_STEPS:]
+            for message in (
+                NEXT_ACTION_MESSAGE,
                 {
                     "role": "assistant",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": step.raw_response,
-                        },
-                    ],
-                }
+                    "content": [{"type": "text", "text": step.raw_response}],
+                },
             )
+        ]
+
+        screenshots, screenshot_url = screenshot_future.result()
+        width, height = screenshots[0].size
+
+        messages = [
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": SYSTEM_TEMPLATE.format(
+                            width=width,
+                            height=height,
+                            date=today_text(),
+                            task=task.description,
+                            tools=tools_text,
+                        ),
+                    }
+                ],
+            }
+        ]
+
+        messages += history_messages
 
         messages.append(
             {
@@ -149,23 +380,30 @@ class OaiActor(Actor[Desktop]):
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {"url": image_to_b64(screenshots[0])},
+                        "image_url": {"url": screenshot_url},
                     },
                 ],
             }
         )
 
-        completion_response = completion(
-            model=self.model,
-            messages=messages,
-            max_tokens=1000,
-            base_url=self.base_url,
-        )
+        if STREAM_COMPLETIONS:
+            completion_response = self._stream_completion(messages)
+        else:
+            completion_response = completion(
+                model=self.model,
+                messages=messages,
+                max_tokens=1000,
+                base_url=self.base_url,
+            )
 
         try:
             content = completion_response.choices[0].message.content
             console.print("Response content: ", content, style="green")
-            content = json_repair.loads(content)
+            # The model almost always returns valid JSON, only repair it when it doesn't
+            try:
+                content = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                content = json_repair.loads(content)
             reflection = content["reflection"]
             observation = content["observation"]
             plan = content["plan"]
@@ -173,8 +411,9 @@ class OaiActor(Actor[Desktop]):
                 name=content["action"]["name"],
                 parameters=content["action"]["parameters"],
             )
-            console.print("action selection: ", style="white")
-            console.print(JSON.from_data(action.model_dump()))
+            if DEBUG:
+                console.print("action selection: ", style="white")
+                console.print(JSON.from_data(action.model_dump()))
 
             thought = f"🤔 {reflection} 👁️ {observation} 💡 {plan}"
             task.post_message("assistant", thought)
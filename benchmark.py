@@ -1,23 +1,49 @@
 import argparse
 import json
 import os
-import time
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from multiprocessing import Pool
+from multiprocessing import get_context
+from multiprocessing.synchronize import Lock as LockType
+from pathlib import Path
 
 from dotenv import load_dotenv
 from rich.console import Console
 
+try:
+    # orjson encodes several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
 from osuniverse.config import Config
 from osuniverse.data.testcase import TestCase
 from osuniverse.data.testcaserun import TestCaseRun
 from osuniverse.runners.surfkit_agent_runner import SurfkitAgentRunner
+from osuniverse.utils import write_bytes_atomic
 from osuniverse.validators.cot_gemini_validator import COTGeminiValidator
 
 load_dotenv()
 
 console = Console()
 
+# Worker processes are forked where possible, so they don't import every module
+# again like spawned ones do. The threads loading the test cases have finished by the
+# time the pool is created, and the clients that start threads of their own are only
+# created inside the workers. Windows only supports spawn.
+MP_CONTEXT = get_context("spawn" if sys.platform == "win32" else "fork")
+
+# Position of each level when sorting test cases, unknown levels go last
+LEVEL_ORDER = {
+    level: order
+    for order, level in enumerate(["paper", "wood", "bronze", "silver", "gold"])
+}
+UNKNOWN_LEVEL = len(LEVEL_ORDER)
+
+# Number of threads loading testcases and their results
+LOAD_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
 
 class RunStatus(Enum):
     COMPLETED = "completed"
@@ -141,116 +167,144 @@ def load_testcases_and_runs(
     selected_levels: list[str] = [],
     mode: str = "run-all",
 ) -> list[tuple[str, str, str, str, TestCase, TestCaseRun | None]]:
-    testcases: list[tuple[str, str, str, str, TestCase, TestCaseRun | None]] = []
-
-    # Get immediate subdirectories (categories)
-    categories = [
-        d
-        for d in os.listdir(testcases_dir)
-        if os.path.isdir(os.path.join(testcases_dir, d))
-    ]
-
-    # Process each category
-    for category_name in categories:
-        category_path = os.path.join(testcases_dir, category_name)
-
-        # Read all yaml files in the category directory
-        for file in os.listdir(category_path):
-            if file.endswith(".yaml"):
-                yaml_path = os.path.join(category_path, file)
-                file_id = os.path.splitext(file)[0]  # Remove extension
-
-                # Create TestCase with category and id
-                testcase = TestCase.from_yaml(
-                    yaml_path, category=category_name, id=file_id
+    def is_selected(testcase: TestCase, testcaserun: TestCaseRun | None) -> bool:
+        """Whether the test case is selected by the mode, given its previous run"""
+        if mode == "run-all":
+            return testcaserun is None or testcaserun.id != testcase.id
+        elif mode == "rerun-failed":
+            return (
+                (testcaserun is not None and testcaserun.human_score == 0)
+                or (
+                    testcaserun is not None
+                    and testcaserun.ai_score == 0
+                    and testcaserun.human_score == -1.0
                 )
+                or (testcaserun is not None and testcaserun.id != testcase.id)
+                or testcaserun is None
+            )
+        elif mode == "validate-only":
+            return testcaserun is not None and testcaserun.id == testcase.id
+        return True
+
+    def load_one(
+        category_name: str, file: str, yaml_path: str
+    ) -> tuple[str, str, str, str, TestCase, TestCaseRun | None] | None:
+        """Load a test case and its previous run, or return None if it isn't selected"""
+        file_id = os.path.splitext(file)[0]  # Remove extension
+        result_name = f"{file_id}.json"
+        has_result = result_name in existing_results[category_name]
+
+        # Only test cases that have been run can be validated
+        if mode == "validate-only" and not has_result:
+            return None
+
+        # Create TestCase with category and id
+        testcase = TestCase.from_yaml(
+            yaml_path,
+            category=category_name,
+            id=file_id,
+            cache_dir=os.path.join(config.results_dir, ".yaml_cache"),
+        )
+        if selected_levels and testcase.level not in selected_levels:
+            return None
 
-                result_category_dir = os.path.join(
-                    config.results_dir, testcase.category
-                )
-                result_path = os.path.join(result_category_dir, f"{testcase.id}.json")
-
-                # Create category directory if it doesn't exist
-                if not os.path.exists(result_category_dir):
-                    os.makedirs(result_category_dir, exist_ok=True)
-
-                if os.path.exists(result_path):
-                    testcaserun = TestCaseRun.from_dict(
-                        json.load(open(result_path, "r"))
-                    )
-                else:
-                    testcaserun = None
-
-                testcases.append(
-                    (
-                        file_id,
-                        testcase.category,
-                        testcase.level,
-                        result_path,
-                        testcase,
-                        testcaserun,
-                    )
-                )
+        result_path = os.path.join(config.results_dir, category_name, result_name)
 
-    if selected_categories != []:
-        testcases = [
-            testcase for testcase in testcases if testcase[1] in selected_categories
-        ]
+        if has_result:
+            # Read as bytes in one call, the file is closed right away
+            testcaserun = TestCaseRun.from_json_bytes(Path(result_path).read_bytes())
+        else:
+            testcaserun = None
+
+        if not is_selected(testcase, testcaserun):
+            return None
+
+        return (
+            file_id,
+            testcase.category,
+            testcase.level,
+            result_path,
+            testcase,
+            testcaserun,
+        )
 
-    if selected_levels != []:
-        testcases = [
-            testcase for testcase in testcases if testcase[2] in selected_levels
+    # Get immediate subdirectories (categories); scandir entries know their type,
+    # so no extra stat call is needed per entry
+    with os.scandir(testcases_dir) as it:
+        categories = [
+            (entry.name, entry.path)
+            for entry in it
+            if entry.is_dir()
+            and (not selected_categories or entry.name in selected_categories)
         ]
 
-    if mode == "run-all":
-        testcases = [
-            testcase
-            for testcase in testcases
-            if (testcase[5] is None or testcase[5].id != testcase[4].id)
-        ]
-    elif mode == "rerun-failed":
-        testcases = [
-            testcase
-            for testcase in testcases
-            if (
-                (testcase[5] is not None and testcase[5].human_score == 0)
-                or (
-                    testcase[5] is not None
-                    and testcase[5].ai_score == 0
-                    and testcase[5].human_score == -1.0
-                )
-                or (testcase[5] is not None and testcase[5].id != testcase[4].id)
-                or testcase[5] is None
+    # All yaml files in the category directories
+    files: list[tuple[str, str, str]] = []
+    # Result file names per category, listed once instead of checked per testcase
+    existing_results: dict[str, set[str]] = {}
+    for category_name, category_path in categories:
+        # Create category directory if it doesn't exist
+        result_category_dir = os.path.join(config.results_dir, category_name)
+        os.makedirs(result_category_dir, exist_ok=True)
+        existing_results[category_name] = set(os.listdir(result_category_dir))
+
+        with os.scandir(category_path) as it:
+            files.extend(
+                (category_name, entry.name, entry.path)
+                for entry in it
+                if entry.name.endswith(".yaml") and entry.is_file()
             )
-        ]
-    elif mode == "validate-only":
+
+    # Loading is mostly file I/O, so the files are loaded in parallel. Test cases
+    # that aren't selected are dropped while loading, before their results are read.
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
         testcases = [
             testcase
-            for testcase in testcases
-            if (testcase[5] is not None and testcase[5].id == testcase[4].id)
+            for testcase in executor.map(lambda args: load_one(*args), files)
+            if testcase is not None
         ]
 
-    def get_level_order(level: str) -> int:
-        return ["paper", "wood", "bronze", "silver", "gold"].index(level)
-
     # Sort by category, level, then id
     testcases = sorted(
         testcases,
-        key=lambda x: (get_level_order(x[2] or ""), x[1] or "", x[0] or ""),
+        key=lambda x: (LEVEL_ORDER.get(x[2], UNKNOWN_LEVEL), x[1] or "", x[0] or ""),
     )
 
     return testcases
 
 
+# Config of the benchmark run, set once per process by init_worker
+worker_config: Config | None = None
+# Lock shared by the runner processes while they allocate ports, if running in parallel
+worker_port_lock: LockType | None = None
+# Runner and validator of the process, created on first use and reused for every
+# test case; created lazily so a failing constructor doesn't break the pool initializer
+worker_runner: SurfkitAgentRunner | None = None
+worker_validator: COTGeminiValidator | None = None
+
+
+def init_worker(config: Config, port_lock: LockType | None = None) -> None:
+    """Set the config of the benchmark run, so it isn't sent along with every test case"""
+    global worker_config, worker_port_lock
+    worker_config = config
+    worker_port_lock = port_lock
+
+
 def run_testcase(
-    args: tuple[TestCase, TestCaseRun | None, str, Config, int, int, int],
+    args: tuple[TestCase, TestCaseRun | None, str, int, int],
 ) -> tuple[RunStatus, str, str, float]:
-    testcase, testcaserun, result_path, config, index, total, sleep_time = args
-
-    # independent instances for each test case, for parallel runs
-    console = Console()
-    runner = SurfkitAgentRunner()
-    validator = COTGeminiValidator()
+    global worker_runner, worker_validator
+    testcase, testcaserun, result_path, index, total = args
+    config = worker_config
+    assert config is not None, "init_worker must be called first"
+
+    # independent instances for each process, for parallel runs
+    if worker_runner is None:
+        worker_runner = SurfkitAgentRunner(port_lock=worker_port_lock)
+    if worker_validator is None:
+        worker_validator = COTGeminiValidator(results_dir=config.results_dir)
+    runner = worker_runner
+    validator = worker_validator
 
     if config.mode == "validate-only" and testcaserun is not None:
         # reset validation results for the test case
@@ -266,7 +320,6 @@ def run_testcase(
         testcaserun.checks = testcase.checks
     else:
         # run the test case
-        time.sleep(sleep_time)
         console.print(
             f"Running test case {index + 1}/{total}: {testcase.id} - {testcase.name}",
             style="bold blue",
@@ -305,8 +358,10 @@ def run_testcase(
                     0,
                 )
 
-    with open(result_path, "w") as f:
-        json.dump(scoredtestcaserun.to_dict(), f)
+    data = scoredtestcaserun.to_dict()
+    write_bytes_atomic(
+        result_path, orjson.dumps(data) if orjson else json.dumps(data).encode()
+    )
 
     console.print(
         f"Test case {index + 1}/{total} completed",
@@ -373,39 +428,38 @@ if __name__ == "__main__":
 
     # Prepare arguments for parallel processing
     args_list = [
-        (testcase[4], testcase[5], testcase[3], config, i, len(testcases), 0)
+        (testcase[4], testcase[5], testcase[3], i, len(testcases))
         for i, testcase in enumerate(testcases)
     ]
-    # We start each next thread 30 seconds later to minimize the port resolution conflicts
-    for i in range(config.runners):
-        if len(args_list) > i:
-            args_list[i] = (
-                args_list[i][0],
-                args_list[i][1],
-                args_list[i][2],
-                args_list[i][3],
-                args_list[i][4],
-                args_list[i][5],
-                i * 30,
-            )
 
     # Run test cases in parallel if runners > 1
     if config.runners > 1:
         console.print(
             f"Running with {config.runners} parallel processes", style="bold green"
         )
-        results: list[tuple[RunStatus, str, str, float]] = []
-        with Pool(config.runners) as pool:
-            # Use imap instead of map to process items one at a time
-            for result in pool.imap(run_testcase, args_list):
+        # Results by result path, as they arrive in completion order
+        results_by_path: dict[str, tuple[RunStatus, str, str, float]] = {}
+        # The config is sent to each worker once, not with every test case
+        # Runners start their containers one at a time to avoid port conflicts
+        port_lock = MP_CONTEXT.Lock()
+        with MP_CONTEXT.Pool(
+            config.runners, initializer=init_worker, initargs=(config, port_lock)
+        ) as pool:
+            # Results are reported as soon as any test case finishes, in any order.
+            # A test case runs for minutes, so tasks are handed out one at a time:
+            # larger chunks would only leave runners idle at the end of the run.
+            for result in pool.imap_unordered(run_testcase, args_list, chunksize=1):
                 status, result_path, message, score = result
-                results.append(result)
+                results_by_path[result_path] = result
                 console.print(
                     message + " " + str(status) + " " + result_path, style="dim"
                 )
+        # The summary lists the test cases in the order they were scheduled
+        results = [results_by_path[args[2]] for args in args_list]
 
     else:
         # Run sequentially if runners = 1
+        init_worker(config)
         results = [run_testcase(args) for args in args_list]
 
     console.print(
@@ -3,29 +3,67 @@ import os
 import re
 import subprocess
 import sys
-from collections import defaultdict
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from typing import Any
 
 from rich.console import Console
 from rich.table import Table
 
 try:
-    import yaml
+    import yaml  # noqa: F401, osuniverse needs it to load testcases
 except ImportError:
     print("Please install PyYAML (pip install pyyaml) to continue.")
     sys.exit(1)
 
+from osuniverse.data.testcase import load_testcase_data
 
-def find_testcase_files(folder: str) -> list[str]:
+
+def find_testcase_files(folder: str) -> Iterator[tuple[str, str]]:
     """
     Recursively find all .yaml files in the given directory (folder).
+    Yields each path with its category, the first subfolder of folder it is in.
+    """
+    # scandir entries know their type, so no extra stat call is needed per entry
+    pending: list[tuple[str, str | None]] = [(folder, None)]
+    while pending:
+        path, category = pending.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append((entry.path, category or entry.name))
+                elif entry.name.endswith(".yaml"):
+                    yield entry.path, category or "unknown"
+
+
+def read_level(testcase_file: tuple[str, str]) -> tuple[str, str | None]:
+    """
+    Read the level of a testcase file, returning its category and level, or None if the file can't be read.
+    """
+    filepath, category = testcase_file
+    try:
+        data: dict[str, Any] = load_testcase_data(filepath) or {}
+    except Exception as e:
+        print(f"Warning: Failed to read '{filepath}' due to: {e}")
+        return category, None
+    return category, data.get("level", "unknown")
+
+
+def map_bounded(
+    executor: Executor, fn: Callable[[Any], Any], items: Iterable[Any], window: int
+) -> Iterator[Any]:
+    """
+    Like executor.map, but with at most window items submitted ahead of the results yielded,
+    so items are only taken from the iterable as the results are consumed.
     """
-    yaml_files: list[str] = []
-    for root, _, files in os.walk(folder):
-        for file in files:
-            if file.endswith(".yaml"):
-                yaml_files.append(os.path.join(root, file))
-    return sorted(yaml_files)
+    pending: deque[Future] = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
 
 
 def do_distribution(folder: str):
@@ -42,16 +80,13 @@ def do_distribution(folder: str):
     )
     categories: set[str] = set()
 
-    for filepath in find_testcase_files(folder):
-        try:
-            with open(filepath, "r") as f:
-                data: dict[str, Any] = yaml.safe_load(f) or {}
-            # Derive category from subfolder rather than file contents
-            relative_path = os.path.relpath(filepath, folder)
-            dir_part = os.path.dirname(relative_path)
-            category = dir_part.split(os.path.sep)[0] if dir_part else "unknown"
-
-            level = data.get("level", "unknown")
+    # Files are read while the directory walk continues, a few files ahead of the counting
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for category, level in map_bounded(
+            executor, read_level, find_testcase_files(folder), window=16
+        ):
+            if level is None:
+                continue
 
             # Track overall level count if recognized
             if level in level_counts:
@@ -62,9 +97,6 @@ def do_distribution(folder: str):
             if level in category_by_level[category]:
                 category_by_level[category][level] += 1
 
-        except Exception as e:
-            print(f"Warning: Failed to read '{filepath}' due to: {e}")
-
     # Create a Console object to display tables
     console = Console()
     console.print(
@@ -1,26 +1,115 @@
 import calendar
+import copy
 import datetime
+import functools
+import hashlib
+import json
+import os
 import re
 from abc import ABC, abstractmethod
 from dataclasses import asdict, dataclass
-from typing import Any, ClassVar, Dict, List, Type, TypeVar, cast
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Type, TypeVar, cast
 
 import yaml
 
+try:
+    # libyaml's C loader parses several times faster than the pure Python one
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore[assignment]
+
 T = TypeVar("T", bound="Check")
 
 
+# Matches [%MONTH+k%] placeholders
+MONTH_PLACEHOLDER_PATTERN = re.compile(r"\[\%MONTH\+(\d+)\%\]")
+# Month names, January first
+MONTH_NAMES = tuple(calendar.month_name[1:])
+# Version of the parsed yaml files in the on-disk cache, to be bumped whenever
+# TestCaseLoader or the placeholder expansion changes what a file parses to
+YAML_CACHE_VERSION = 1
+
+
 def expand_month_placeholders(text: str) -> str:
     """Replace [%MONTH+k%] with the month name offset by k from the current month."""
-    pattern = re.compile(r"\[\%MONTH\+(\d+)\%\]")
+    if "[%MONTH+" not in text:
+        return text
+
+    month_index = datetime.datetime.now().month - 1
+    return MONTH_PLACEHOLDER_PATTERN.sub(
+        lambda match: MONTH_NAMES[(month_index + int(match.group(1))) % 12], text
+    )
+
+
+class TestCaseLoader(SafeLoader):
+    """A yaml loader that expands month placeholders while the strings are parsed."""
 
-    def month_replacer(match: re.Match[str]) -> str:
-        offset = int(match.group(1))
-        now = datetime.datetime.now()
-        new_month = (now.month - 1 + offset) % 12 + 1
-        return calendar.month_name[new_month]
 
-    return pattern.sub(month_replacer, text)
+def _construct_str(loader: TestCaseLoader, node: yaml.ScalarNode) -> str:
+    return expand_month_placeholders(loader.construct_scalar(node))
+
+
+TestCaseLoader.add_constructor("tag:yaml.org,2002:str", _construct_str)
+
+
+@functools.lru_cache(maxsize=512)
+def _load_yaml_data(
+    yaml_path: str, mtime_ns: int, size: int, month: int, cache_dir: Optional[str]
+) -> Any:
+    """Parse a yaml file, keyed on its modification time and size so edits are picked up.
+
+    Placeholders are expanded for the current month, so the month is part of the key.
+    If cache_dir is given, the parsed data is also stored there as JSON under the
+    SHA-256 of the file contents, the month and YAML_CACHE_VERSION, so later runs
+    don't parse unchanged files again. The cache is best effort, a cache that can't be
+    read or written is ignored.
+    """
+    with open(yaml_path, "rb") as f:
+        content = f.read()
+
+    cache_path = None
+    if cache_dir is not None:
+        digest = hashlib.sha256(content).hexdigest()
+        cache_path = os.path.join(
+            cache_dir, f"{digest}-{month}-v{YAML_CACHE_VERSION}.json"
+        )
+        try:
+            with open(cache_path, "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            pass
+
+    data = yaml.load(content, Loader=TestCaseLoader)
+
+    if cache_path is not None:
+        # Write to a temporary file first, so a parallel run never reads a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError):
+            # e.g. a read-only results directory, or values JSON can't represent
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    return data
+
+
+def load_testcase_data(yaml_path: str, cache_dir: Optional[str] = None) -> Any:
+    """Load the data of a testcase yaml file, parsing each file version only once.
+
+    Month placeholders in the strings are already expanded. A copy is returned, so
+    callers are free to modify it.
+    """
+    stat = os.stat(yaml_path)
+    month = datetime.date.today().month
+    return copy.deepcopy(
+        _load_yaml_data(yaml_path, stat.st_mtime_ns, stat.st_size, month, cache_dir)
+    )
 
 
 class Check(ABC):
@@ -30,19 +119,16 @@ class Check(ABC):
     def to_dict(self) -> Dict[str, Any]:
         pass
 
-    @abstractmethod
-    def expand_placeholders(self) -> None:
-        """Apply placeholder expansion to relevant attributes."""
-        pass
-
     @classmethod
     def from_dict(cls: Type[T], data: Dict[str, Any]) -> T:
         check_type = data.pop("type", None)
         if check_type is None:
             raise ValueError("Missing check type in data.")
-        if check_type not in CHECK_REGISTRY:
-            raise ValueError(f"Unknown check type: {check_type}")
-        return cast(T, CHECK_REGISTRY[check_type].from_data(data))
+        try:
+            constructor = CHECK_CONSTRUCTORS[check_type]
+        except KeyError:
+            raise ValueError(f"Unknown check type: {check_type}") from None
+        return cast(T, constructor(data))
 
     @classmethod
     @abstractmethod
@@ -53,11 +139,14 @@ class Check(ABC):
 
 # Registry to hold mapping of check types to classes
 CHECK_REGISTRY: Dict[str, Type[Check]] = {}
+# Check types mapped to the bound from_data of their classes, used by Check.from_dict
+CHECK_CONSTRUCTORS: Dict[str, Callable[[Dict[str, Any]], Check]] = {}
 
 
 def register_check(check_type: str):
     def decorator(cls: Type[Check]):
         CHECK_REGISTRY[check_type] = cls
+        CHECK_CONSTRUCTORS[check_type] = cls.from_data
         cls.CHECK_TYPE = check_type
         return cls
 
@@ -72,9 +161,6 @@ class ReturnedResultCheck(Check):
     def to_dict(self) -> Dict[str, Any]:
         return {"type": self.CHECK_TYPE, "value": self.returned_result}
 
-    def expand_placeholders(self) -> None:
-        self.returned_result = expand_month_placeholders(self.returned_result)
-
     @classmethod
     def from_data(cls, data: Dict[str, Any]) -> "ReturnedResultCheck":
         return cls(returned_result=data["value"])
@@ -88,9 +174,6 @@ class FinalScreenshotCheck(Check):
     def to_dict(self) -> Dict[str, Any]:
         return {"type": self.CHECK_TYPE, "value": self.final_screenshot}
 
-    def expand_placeholders(self) -> None:
-        self.final_screenshot = expand_month_placeholders(self.final_screenshot)
-
     @classmethod
     def from_data(cls, data: Dict[str, Any]) -> "FinalScreenshotCheck":
         return cls(final_screenshot=data["value"])
@@ -104,9 +187,6 @@ class ExpectedFlowCheck(Check):
     def to_dict(self) -> Dict[str, Any]:
         return {"type": self.CHECK_TYPE, "value": self.expected_flow}
 
-    def expand_placeholders(self) -> None:
-        self.expected_flow = expand_month_placeholders(self.expected_flow)
-
     @classmethod
     def from_data(cls, data: Dict[str, Any]) -> "ExpectedFlowCheck":
         return cls(expected_flow=data["value"])
@@ -125,16 +205,12 @@ class CommandOutputCheck(Check):
             "value": self.command_output,
         }
 
-    def expand_placeholders(self) -> None:
-        self.command = expand_month_placeholders(self.command)
-        self.command_output = expand_month_placeholders(self.command_output)
-
     @classmethod
     def from_data(cls, data: Dict[str, Any]) -> "CommandOutputCheck":
         return cls(command=data["command"], command_output=data["value"])
 
 
-@dataclass
+@dataclass(slots=True)
 class TestCase:
     id: str
     name: str
@@ -146,24 +222,22 @@ class TestCase:
     checks: List[Check]
 
     @classmethod
-    def from_yaml(cls, yaml_path: str, category: str, id: str) -> "TestCase":
-        with open(yaml_path, "r") as f:
-            data = yaml.safe_load(f)
+    def from_yaml(
+        cls,
+        yaml_path: str,
+        category: str,
+        id: str,
+        cache_dir: Optional[str] = None,
+    ) -> "TestCase":
+        data = load_testcase_data(yaml_path, cache_dir)
         data["category"] = category
         data["id"] = id
 
         # Convert check dictionaries to Check objects
         checks_data = data.pop("checks", [])
         checks = [Check.from_dict(check_dict) for check_dict in checks_data]
-        test = cls(checks=checks, **data)
-        test.expand_placeholders()
-
-        return test
-
-    def expand_placeholders(self) -> None:
-        self.task = expand_month_placeholders(self.task)
-        for check in self.checks:
-            check.expand_placeholders()
+        # Placeholders were expanded while loading the yaml file
+        return cls(checks=checks, **data)
 
     def to_json_dict(self) -> Dict[str, Any]:
         """Serialize the TestCase to a dict suitable for JSON output."""
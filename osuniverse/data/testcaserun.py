@@ -1,11 +1,22 @@
+import base64
+import bisect
+import json
+import mimetypes
+import os
 from dataclasses import dataclass, field
 from typing import Any, Optional
 
+try:
+    # orjson parses several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
 from ..config import Config
 from .testcase import Check, TestCase
 
 
-@dataclass
+@dataclass(slots=True)
 class Step:
     timestamp: float
     action: str
@@ -29,8 +40,27 @@ class Step:
             screenshot=data["screenshot"] if "screenshot" in data else "",
         )
 
+    def screenshot_bytes(self, base_dir: str = ".") -> Optional[bytes]:
+        """Read the screenshot from its data URI, or from its file relative to base_dir"""
+        if not self.screenshot:
+            return None
+        if self.screenshot.startswith("data:"):
+            return base64.b64decode(self.screenshot.split(",", 1)[1])
+        if "://" in self.screenshot:
+            return None  # remote screenshots are not downloaded
+        try:
+            with open(os.path.join(base_dir, self.screenshot), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def screenshot_mime_type(self) -> str:
+        if self.screenshot and self.screenshot.startswith("data:"):
+            return self.screenshot.split(";", 1)[0][len("data:") :]
+        return mimetypes.guess_type(self.screenshot or "")[0] or "image/png"
+
 
-@dataclass
+@dataclass(slots=True)
 class CommandOutputCheckResult:
     command: str
     output: str
@@ -49,7 +79,7 @@ class CommandOutputCheckResult:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class TestCaseRun(TestCase):
     agent_yaml: str
     agent_model: str
@@ -86,7 +116,9 @@ class TestCaseRun(TestCase):
         )
 
     def add_step(self, step: Step):
-        self.trajectory.append(step)
+        """Add a step, keeping the trajectory ordered by timestamp"""
+        # Steps mostly arrive in order, so this is usually an append
+        bisect.insort(self.trajectory, step, key=lambda x: x.timestamp)
 
     def to_dict(self) -> dict[str, Any]:
         return {
@@ -103,9 +135,20 @@ class TestCaseRun(TestCase):
             "max_steps": self.max_steps,
             "status": self.status,
             "result": self.result.to_dict() if self.result else None,
-            "trajectory": [step.to_dict() for step in self.trajectory],
+            # Steps and command outputs are inlined rather than calling their to_dict,
+            # long trajectories have hundreds of steps
+            "trajectory": [
+                {
+                    "timestamp": step.timestamp,
+                    "action": step.action,
+                    "thought": step.thought,
+                    "screenshot": step.screenshot,
+                }
+                for step in self.trajectory
+            ],
             "command_output_check_results": [
-                result.to_dict() for result in self.command_output_check_results
+                {"command": result.command, "output": result.output}
+                for result in self.command_output_check_results
             ],
             "input_tokens": self.input_tokens,
             "output_tokens": self.output_tokens,
@@ -117,6 +160,12 @@ class TestCaseRun(TestCase):
             "validation_output_tokens": self.validation_output_tokens,
         }
 
+    @staticmethod
+    def from_json_bytes(content: bytes):
+        """Create a TestCaseRun from the contents of a result file."""
+        data = orjson.loads(content) if orjson else json.loads(content)
+        return TestCaseRun.from_dict(data)
+
     @staticmethod
     def from_dict(data: dict[str, Any]):
         return TestCaseRun(
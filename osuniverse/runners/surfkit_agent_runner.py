@@ -1,11 +1,13 @@
 import base64
+import mimetypes
 import random
+import shutil
 import subprocess
 import time
 import uuid
 import os
-from io import BytesIO
-from typing import List
+from contextlib import AbstractContextManager, nullcontext
+from typing import List, Optional
 
 from agentdesk import Desktop
 from PIL import Image
@@ -24,12 +26,32 @@ console = Console()
 
 TRACKER_IMAGE = "us-central1-docker.pkg.dev/agentsea-dev/taskara/api:884e381"
 
+# Final screenshots are stored as JPEG, which is several times smaller than PNG
+# and much faster to encode for a full desktop
+SCREENSHOT_JPEG_QUALITY = 85
+# Screenshots are written to files in this directory of the results directory,
+# and the steps only keep their paths
+ARTIFACTS_DIR = "artifacts"
+
 
 class SurfkitAgentRunner(BaseRunner):
-    def __init__(self):
+    def __init__(self, port_lock: Optional[AbstractContextManager] = None):
         super().__init__()
+        # held while the desktop and the tracker containers are started, so that
+        # parallel runners don't pick the same free ports; setup commands and waits
+        # run outside of it
+        self.port_lock = port_lock if port_lock is not None else nullcontext()
+        # background `surfkit list` commands, reaped once they have finished
+        self.cleanup_processes: List[subprocess.Popen] = []
 
     def run(self, testcase: TestCase, config: Config) -> TestCaseRun:
+        desktop_name, desktop, tracker_name = self.create_desktop_and_tracker(testcase)
+
+        return self.run_task(testcase, config, desktop_name, desktop, tracker_name)
+
+    def create_desktop_and_tracker(
+        self, testcase: TestCase
+    ) -> tuple[str | None, Desktop, str | None]:
         # 1. Create a desktop with a random name from a given image and execute the setup script
         desktop_name = None
         for i_try in range(5):
@@ -39,9 +61,10 @@ class SurfkitAgentRunner(BaseRunner):
                     f"🚀 Creating a desktop with name {desktop_name}...",
                     style="dim",
                 )
-                desktop = Desktop.docker(
-                    name=desktop_name, image=testcase.desktop_image
-                )
+                with self.port_lock:
+                    desktop = Desktop.docker(
+                        name=desktop_name, image=testcase.desktop_image
+                    )
                 break
             except Exception as e:
                 n = random.randint(0, 10)
@@ -70,17 +93,18 @@ class SurfkitAgentRunner(BaseRunner):
                 console.print(
                     f"🚀 Creating a tracker with name {tracker_name}...", style="dim"
                 )
-                subprocess.run(
-                    [
-                        "surfkit",
-                        "create",
-                        "tracker",
-                        "--name",
-                        tracker_name,
-                        "--image",
-                        TRACKER_IMAGE,
-                    ]
-                )
+                with self.port_lock:
+                    subprocess.run(
+                        [
+                            "surfkit",
+                            "create",
+                            "tracker",
+                            "--name",
+                            tracker_name,
+                            "--image",
+                            TRACKER_IMAGE,
+                        ]
+                    )
                 time.sleep(5)
                 break
             except Exception as e:
@@ -99,7 +123,16 @@ class SurfkitAgentRunner(BaseRunner):
                     self.delete_desktop(desktop_name)
                     raise e
         console.print(f"🚀 Tracker {tracker_name} created", style="bold green")
+        return desktop_name, desktop, tracker_name
 
+    def run_task(
+        self,
+        testcase: TestCase,
+        config: Config,
+        desktop_name: str | None,
+        desktop: Desktop,
+        tracker_name: str | None,
+    ) -> TestCaseRun:
         testcaserun = TestCaseRun.from_testcase(testcase, config)
 
         # 2. Run `solve` using a correct agent (depending on the config)
@@ -164,64 +197,78 @@ class SurfkitAgentRunner(BaseRunner):
         ):  # If the task is properly instrumented, we can use the actions
             console.print(f"Found {len(actions)} actions", style="bold blue")
             for action in actions:
+                metadata = action.metadata
+                images = action.state.images  # type: ignore
                 testcaserun.add_step(
                     Step(
                         action.created,
                         str(action.action),
-                        action.metadata["thought"]
-                        if "thought" in action.metadata
-                        else "",
-                        action.state.images[0]  # type: ignore
-                        if len(action.state.images) > 0  # type: ignore
-                        else None,
+                        metadata.get("thought", ""),
+                        images[0] if images else None,
                     )
                 )
-                testcaserun.input_tokens += (
-                    action.metadata["input_tokens"]
-                    if "input_tokens" in action.metadata
-                    else 0
-                )
-                testcaserun.output_tokens += (
-                    action.metadata["output_tokens"]
-                    if "output_tokens" in action.metadata
-                    else 0
-                )
+                testcaserun.input_tokens += metadata.get("input_tokens", 0)
+                testcaserun.output_tokens += metadata.get("output_tokens", 0)
         else:  # If the task is not properly instrumented, we use the messages,
             # but it's not guaranteed to be in order and generally has more noise
             threads = task.threads
             console.print(f"Found {len(threads)} threads", style="bold blue")
             for thread in threads:
+                # messages() builds the list anew on every call
+                thread_messages = thread.messages()
                 console.print(
-                    f"Found {len(thread.messages())} messages", style="bold blue"
+                    f"Found {len(thread_messages)} messages", style="bold blue"
                 )
-                for message in thread.messages():
+                for message in thread_messages:
+                    images = message.images  # type: ignore
                     testcaserun.add_step(
                         Step(
                             message.created,
                             message.text,
                             "",
-                            message.images[0]  # type: ignore
-                            if len(message.images) > 0  # type: ignore
-                            else None,
+                            images[0] if images else None,
                         )
                     )
 
+        # Screenshots of the previous run of this test case are replaced
+        artifacts_dir = os.path.join(ARTIFACTS_DIR, testcase.category, testcase.id)
+        shutil.rmtree(
+            os.path.join(config.results_dir, artifacts_dir), ignore_errors=True
+        )
+        os.makedirs(os.path.join(config.results_dir, artifacts_dir))
+
         # Grab the latest screenshot & the potential result action if any
         last_state_img: Image.Image = desktop.take_screenshots(count=1, delay=0.0)[0]  # type: ignore
-        last_state_base64: str = self.pil_image_to_data_uri(last_state_img)  # type: ignore
-        potential_result_actions = [
-            action.action.parameters["value"]
-            for action in sorted(actions, key=lambda x: x.created, reverse=True)
-            if action.action.name == "result" and "value" in action.action.parameters
-        ]
+        last_state_path = os.path.join(artifacts_dir, "result.jpg")
+        self.save_image(
+            last_state_img, os.path.join(config.results_dir, last_state_path)
+        )
+        # Only the latest result is used, so a single pass finds it without sorting
+        latest_result = max(
+            (
+                action
+                for action in actions
+                if action.action.name == "result"
+                and "value" in action.action.parameters
+            ),
+            key=lambda x: x.created,
+            default=None,
+        )
+        potential_result_actions = (
+            [latest_result.action.parameters["value"]] if latest_result else []
+        )
         if len(potential_result_actions) == 0:  # let's try to find the action in chat
             threads = task.threads
             messages: List[RoleMessage] = []
             for thread in threads:
                 messages.extend(thread.messages())
-            for message in sorted(messages, key=lambda x: x.created, reverse=True):
-                if "result" in message.text:
-                    potential_result_actions.append(message.text)
+            latest_message = max(
+                (message for message in messages if "result" in message.text),
+                key=lambda x: x.created,
+                default=None,
+            )
+            if latest_message:
+                potential_result_actions.append(latest_message.text)
         console.print(
             f"🚀 Potential results: {potential_result_actions}",
             style="yellow",
@@ -232,14 +279,14 @@ class SurfkitAgentRunner(BaseRunner):
                 time.time(),
                 potential_result_actions[0],
                 "",
-                last_state_base64,
+                last_state_path,
             )
         else:
             testcaserun.result = Step(
                 time.time(),
                 "No result found; run is complete.",
                 "",
-                last_state_base64,
+                last_state_path,
             )
 
         first_step = testcaserun.trajectory[0]
@@ -254,31 +301,101 @@ class SurfkitAgentRunner(BaseRunner):
         )
 
         # 4. Run commands and check the output (if any)
-        for check in testcase.checks:
-            if isinstance(check, CommandOutputCheck):
-                result: str = desktop.exec(check.command)  # type: ignore
-                command_output_check_result = CommandOutputCheckResult(
-                    command=check.command,  # type: ignore
-                    output=result,  # type: ignore
-                )
-                testcaserun.command_output_check_results.append(
-                    command_output_check_result
-                )
+        command_checks = [
+            check for check in testcase.checks if isinstance(check, CommandOutputCheck)
+        ]
+        outputs = self.exec_commands(
+            desktop, [check.command for check in command_checks]  # type: ignore
+        )
+        for check, result in zip(command_checks, outputs):
+            command_output_check_result = CommandOutputCheckResult(
+                command=check.command,  # type: ignore
+                output=result,  # type: ignore
+            )
+            testcaserun.command_output_check_results.append(command_output_check_result)
 
         # 5. Delete the desktop and tracker
         self.delete_desktop(desktop_name)
         self.delete_tracker(tracker_name)
 
         # 6. Return the trajectory & command output check results
-        testcaserun.trajectory.sort(key=lambda x: x.timestamp)
+        for index, step in enumerate(testcaserun.trajectory):
+            step.screenshot = self.save_screenshot(
+                step.screenshot,
+                config.results_dir,
+                os.path.join(artifacts_dir, str(index)),
+            )
         return testcaserun
 
-    def pil_image_to_data_uri(self, image: Image.Image) -> str:
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_bytes = buffered.getvalue()  # the raw PNG bytes
-        img_base64 = base64.b64encode(img_bytes).decode("utf-8")
-        return f"data:image/png;base64,{img_base64}"
+    def exec_commands(self, desktop: Desktop, commands: List[str]) -> list:
+        """Run the commands on the desktop in a single exec call, and split the output per command.
+
+        Each command runs in its own subshell with stderr merged into stdout, so a `cd`
+        doesn't affect the next one and a failing command doesn't hide the output of the
+        others. Each command gets the exec result with only its own part of the output.
+        """
+        if len(commands) <= 1:
+            return [desktop.exec(command) for command in commands]
+
+        marker = f"__osuniverse_output_{uuid.uuid4().hex}__"
+        script = "".join(
+            f"echo {marker}\n(\n{command}\n) 2>&1\n" for command in commands
+        )
+        # The script always succeeds, the exec result only reports the last status
+        result = desktop.exec(script + "true\n")
+        # Desktop.exec returns a dict with the status and the output of the command
+        output = result.get("output", "") if isinstance(result, dict) else result
+        parts = output.split(marker) if isinstance(output, str) else []
+        if len(parts) != len(commands) + 1:
+            # The commands have run already, so they are not run again one by one
+            console.print(
+                "‼️  Failed to split the output of the check commands, "
+                "every check gets the whole output",
+                style="bold red",
+            )
+            return [result] * len(commands)
+        if not isinstance(result, dict):
+            return [part.strip() for part in parts[1:]]
+        return [{**result, "output": part.strip()} for part in parts[1:]]
+
+    def save_screenshot(
+        self, screenshot: str | None, results_dir: str, name: str
+    ) -> str | None:
+        """Write a data URI screenshot to a file, and return its path relative to results_dir.
+
+        The extension is added to name. Other screenshots, such as URLs, are returned as is.
+        """
+        if not screenshot or not screenshot.startswith("data:"):
+            return screenshot
+        header, data = screenshot.split(",", 1)
+        mime_type = header.split(";", 1)[0][len("data:") :]
+        path = name + (mimetypes.guess_extension(mime_type) or ".png")
+        with open(os.path.join(results_dir, path), "wb") as f:
+            f.write(base64.b64decode(data))
+        return path
+
+    def save_image(self, image: Image.Image, path: str) -> None:
+        # JPEG has no alpha channel
+        image.convert("RGB").save(path, format="JPEG", quality=SCREENSHOT_JPEG_QUALITY)
+
+    def clean_up_surfkit_list(self, kind: str):
+        """Let surfkit drop removed containers from its list of trackers or devices.
+
+        Listing them is what triggers the clean up, the output isn't needed, so the
+        command runs in the background instead of holding up the runner. Commands
+        started by earlier calls are reaped here once they have finished.
+        """
+        self.cleanup_processes = [
+            process for process in self.cleanup_processes if process.poll() is None
+        ]
+        self.cleanup_processes.append(
+            subprocess.Popen(
+                ["surfkit", "list", kind],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+        console.print(f"🗑️ Cleaning up the {kind} list", style="dim")
 
     def delete_tracker(self, tracker_name: str | None):
         console.print(f"🗑️ Deleting the tracker {tracker_name}", style="dim")
@@ -287,10 +404,7 @@ class SurfkitAgentRunner(BaseRunner):
         try:
             subprocess.run(["docker", "rm", "-v", "-f", tracker_name])
             console.print(f"🗑️ Tracker {tracker_name} deleted", style="dim")
-            _ = subprocess.run(
-                ["surfkit", "list", "trackers"], capture_output=True, text=True
-            )
-            console.print("🗑️ Cleaned up the trackers list", style="dim")
+            self.clean_up_surfkit_list("trackers")
         except Exception as e:
             console.print(
                 f"🗑️ Tracker {tracker_name} deletion failed: {e}", style="dim"
@@ -303,10 +417,7 @@ class SurfkitAgentRunner(BaseRunner):
         try:
             subprocess.run(["docker", "rm", "-v", "-f", desktop_name])
             console.print(f"🗑️ Desktop {desktop_name} deleted", style="dim")
-            _ = subprocess.run(
-                ["surfkit", "list", "devices"], capture_output=True, text=True
-            )
-            console.print("🗑️ Cleaned up the devices list", style="dim")
+            self.clean_up_surfkit_list("devices")
         except Exception as e:
             console.print(
                 f"🗑️ Desktop {desktop_name} deletion failed: {e}", style="dim"
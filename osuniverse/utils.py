@@ -1,8 +1,17 @@
 import json
 import os
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
 
+try:
+    # orjson encodes and parses several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
 from osuniverse.data.testcaserun import TestCaseRun
 
 WEIGHTS: dict[str, float] = {
@@ -13,6 +22,21 @@ WEIGHTS: dict[str, float] = {
     "gold": 8,
 }
 
+# Initial statistics of a level or a category
+EMPTY_GROUP_STATS: dict[str, int | float] = {
+    "amount": 0,
+    "passed": 0,
+    "duration": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "validation_input_tokens": 0,
+    "validation_output_tokens": 0,
+}
+
+# Result sets smaller than this are loaded in the calling process, where starting
+# worker processes would cost more than it saves
+PARALLEL_STATS_MIN_FILES = 64
+
 
 def find_json_files(directory: str) -> list[str]:
     """Recursively find all JSON files in the given directory."""
@@ -25,14 +49,31 @@ def find_json_files(directory: str) -> list[str]:
 
 
 def load_scored_run(json_path: str) -> TestCaseRun:
-    with open(json_path, "r") as f:
-        data = json.load(f)
-    return TestCaseRun.from_dict(data)
+    with open(json_path, "rb") as f:
+        return TestCaseRun.from_json_bytes(f.read())
+
+
+def write_bytes_atomic(path: str, content: bytes):
+    """Write a file through a temporary file in the same directory, so readers and
+    parallel writers never see a partially written file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 def save_scored_run(json_path: str, run: TestCaseRun):
-    with open(json_path, "w") as f:
-        json.dump(run.to_dict(), f, indent=2)
+    data = run.to_dict()
+    if orjson:
+        content = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        content = json.dumps(data, indent=2).encode()
+    write_bytes_atomic(json_path, content)
 
 
 def format_timestamp(timestamp: float) -> str:
@@ -48,6 +89,97 @@ def format_number(num: int | float) -> str:
     return str(int(num))
 
 
+@dataclass(slots=True)
+class RunStats:
+    """The fields of a scored run that the statistics are calculated from."""
+
+    category: str
+    level: str
+    ai_score: float
+    human_score: float
+    # None if the run has no steps
+    duration: float | None
+    input_tokens: int
+    output_tokens: int
+    validation_input_tokens: int
+    validation_output_tokens: int
+
+
+def load_run_stats(json_path: str) -> RunStats | None:
+    """Load the statistics fields of a scored run, or None if it can't be loaded.
+
+    Only these fields are read from the decoded JSON, the steps, checks and command
+    outputs of the run are never turned into objects.
+    """
+    try:
+        with open(json_path, "rb") as f:
+            content = f.read()
+        data = orjson.loads(content) if orjson else json.loads(content)
+        trajectory = data["trajectory"]
+        return RunStats(
+            category=data["category"],
+            level=data["level"],
+            ai_score=data["ai_score"],
+            human_score=data["human_score"],
+            duration=(
+                trajectory[-1]["timestamp"] - trajectory[0]["timestamp"]
+                if trajectory
+                else None
+            ),
+            input_tokens=data["input_tokens"],
+            output_tokens=data["output_tokens"],
+            validation_input_tokens=data.get("validation_input_tokens", 0),
+            validation_output_tokens=data.get("validation_output_tokens", 0),
+        )
+    except Exception:
+        return None
+
+
+# Statistics of the scored runs loaded so far, by path, together with the
+# modification time and size of the file they were loaded from
+_RUN_STATS_CACHE: dict[str, tuple[tuple[int, int], RunStats | None]] = {}
+
+
+def _file_version(path: str) -> tuple[int, int] | None:
+    """The modification time and size of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_all_run_stats(json_files: list[str]) -> Iterator[RunStats | None]:
+    """Load the statistics fields of many scored runs, using all cores for large sets.
+
+    Only files that changed since they were last loaded are read again, so refreshing
+    the statistics of a results directory only loads the new and rescored runs. Only
+    the small RunStats are sent back from the worker processes, not the runs with
+    their screenshots.
+    """
+    versions = [_file_version(path) for path in json_files]
+    stale = [
+        path
+        for path, version in zip(json_files, versions)
+        if version is None or _RUN_STATS_CACHE.get(path, (None,))[0] != version
+    ]
+
+    if len(stale) < PARALLEL_STATS_MIN_FILES:
+        loaded = dict(zip(stale, map(load_run_stats, stale)))
+    else:
+        with ProcessPoolExecutor() as executor:
+            loaded = dict(zip(stale, executor.map(load_run_stats, stale, chunksize=32)))
+
+    for path, version in zip(json_files, versions):
+        if path in loaded:
+            stats = loaded[path]
+            if version is not None:
+                _RUN_STATS_CACHE[path] = (version, stats)
+            yield stats
+        else:
+            yield _RUN_STATS_CACHE[path][1]
+
+
 def calculate_stats(json_files: list[str]) -> dict[str, int | float | dict[str, Any]]:
     """Calculate statistics for all test runs."""
     total = len(json_files)
@@ -71,94 +203,64 @@ def calculate_stats(json_files: list[str]) -> dict[str, int | float | dict[str,
 
     by_categories_by_level: dict[str, dict[str, Any]] = {}
 
-    for file in json_files:
-        try:
-            run = load_scored_run(file)
-            loaded += 1
-            score = run.ai_score if run.human_score < 0 else run.human_score
-            if score > 0:
-                passed += 1
-            if run.ai_score >= 1.0:
-                ai_passed += 1
-            elif run.ai_score == -1.0:
-                ai_errors += 1
-            if run.human_score >= 1.0:
-                human_passed += 1
-            elif run.human_score == 0:
-                human_failed += 1
-            else:  # human_score == -1
-                human_unreviewed += 1
-            if (
-                run.ai_score != run.human_score
-                and run.ai_score != -1.0
-                and run.human_score != -1.0
-            ):
-                disagreements += 1
-            run_duration = run.trajectory[-1].timestamp - run.trajectory[0].timestamp
-
-            total_duration += run_duration
-            total_input_tokens += run.input_tokens
-            total_output_tokens += run.output_tokens
-            total_validation_input_tokens += run.validation_input_tokens
-            total_validation_output_tokens += run.validation_output_tokens
-
-            if run.category not in by_categories:
-                by_categories_by_level[run.category] = {}
-            if run.level not in by_categories_by_level[run.category]:
-                by_categories_by_level[run.category][run.level] = {
-                    "amount": 0,
-                    "passed": 0,
-                }
-            by_categories_by_level[run.category][run.level]["amount"] += 1
-            by_categories_by_level[run.category][run.level]["passed"] += (
-                1 if score > 0 else 0
-            )
-
-            if run.level not in by_levels:
-                by_levels[run.level] = {
-                    "amount": 0,
-                    "passed": 0,
-                    "duration": 0,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
-                    "validation_input_tokens": 0,
-                    "validation_output_tokens": 0,
-                }
-            by_levels[run.level]["amount"] += 1
-            by_levels[run.level]["passed"] += 1 if score > 0 else 0
-            by_levels[run.level]["duration"] += run_duration
-            by_levels[run.level]["input_tokens"] += run.input_tokens
-            by_levels[run.level]["output_tokens"] += run.output_tokens
-            by_levels[run.level]["validation_input_tokens"] += (
-                run.validation_input_tokens
-            )
-            by_levels[run.level]["validation_output_tokens"] += (
-                run.validation_output_tokens
-            )
-
-            if run.category not in by_categories:
-                by_categories[run.category] = {
-                    "amount": 0,
-                    "passed": 0,
-                    "duration": 0,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
-                    "validation_input_tokens": 0,
-                    "validation_output_tokens": 0,
-                }
-            by_categories[run.category]["amount"] += 1
-            by_categories[run.category]["passed"] += 1 if score > 0 else 0
-            by_categories[run.category]["duration"] += run_duration
-            by_categories[run.category]["input_tokens"] += run.input_tokens
-            by_categories[run.category]["output_tokens"] += run.output_tokens
-            by_categories[run.category]["validation_input_tokens"] += (
-                run.validation_input_tokens
-            )
-            by_categories[run.category]["validation_output_tokens"] += (
-                run.validation_output_tokens
-            )
-        except Exception:
+    for run in load_all_run_stats(json_files):
+        if run is None:
+            continue
+        loaded += 1
+        score = run.ai_score if run.human_score < 0 else run.human_score
+        if score > 0:
+            passed += 1
+        if run.ai_score >= 1.0:
+            ai_passed += 1
+        elif run.ai_score == -1.0:
+            ai_errors += 1
+        if run.human_score >= 1.0:
+            human_passed += 1
+        elif run.human_score == 0:
+            human_failed += 1
+        else:  # human_score == -1
+            human_unreviewed += 1
+        if (
+            run.ai_score != run.human_score
+            and run.ai_score != -1.0
+            and run.human_score != -1.0
+        ):
+            disagreements += 1
+        if run.duration is None:
+            # Runs without steps only count towards the totals above
             continue
+        run_duration = run.duration
+
+        total_duration += run_duration
+        total_input_tokens += run.input_tokens
+        total_output_tokens += run.output_tokens
+        total_validation_input_tokens += run.validation_input_tokens
+        total_validation_output_tokens += run.validation_output_tokens
+
+        # The per level and per category totals are updated through local references,
+        # so each of their keys is only looked up once
+        run_passed = 1 if score > 0 else 0
+        input_tokens = run.input_tokens
+        output_tokens = run.output_tokens
+        validation_input_tokens = run.validation_input_tokens
+        validation_output_tokens = run.validation_output_tokens
+        for group in (
+            by_levels.setdefault(run.level, dict(EMPTY_GROUP_STATS)),
+            by_categories.setdefault(run.category, dict(EMPTY_GROUP_STATS)),
+        ):
+            group["amount"] += 1
+            group["passed"] += run_passed
+            group["duration"] += run_duration
+            group["input_tokens"] += input_tokens
+            group["output_tokens"] += output_tokens
+            group["validation_input_tokens"] += validation_input_tokens
+            group["validation_output_tokens"] += validation_output_tokens
+
+        category_level = by_categories_by_level.setdefault(run.category, {}).setdefault(
+            run.level, {"amount": 0, "passed": 0}
+        )
+        category_level["amount"] += 1
+        category_level["passed"] += run_passed
 
     reviewed = human_passed + human_failed
 
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import List
 
@@ -9,6 +10,9 @@ from osuniverse.data.testcaserun import TestCaseRun
 
 console = Console()
 
+# Maximum number of checks of a test case run that are validated at the same time
+MAX_CONCURRENT_CHECKS = 4
+
 
 @dataclass
 class CheckResult:
@@ -20,33 +24,47 @@ class CheckResult:
 
 
 class BaseValidator(ABC):
+    # Validators with tight rate limits can lower this, 1 validates checks one by one
+    max_concurrent_checks: int = MAX_CONCURRENT_CHECKS
+
     def __init__(self):
         pass
 
     def validate(self, testcaserun: TestCaseRun) -> TestCaseRun:
-        check_results: List[CheckResult] = []
-
-        for check in testcaserun.checks:
-            check_result = self.validate_check(check, testcaserun)
-            if check_result.score != -1:
-                check_results.append(check_result)
-                console.print(
-                    f"Check {check.CHECK_TYPE} | score: {check_result.score} | result: {check_result.result}"
+        checks = testcaserun.checks
+        workers = min(len(checks), self.max_concurrent_checks)
+        if workers <= 1:
+            # No thread pool for a single check
+            results = [self.validate_check(check, testcaserun) for check in checks]
+        else:
+            # Checks are independent model requests, so they run concurrently
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(
+                    executor.map(
+                        lambda check: self.validate_check(check, testcaserun), checks
+                    )
                 )
 
-        score: int = 0 if any(cr.score == 0 for cr in check_results) else 1
-        comment: str = ""
-        for cr in check_results:
-            comment += f" 🔹 Check {cr.check.CHECK_TYPE} | score: {cr.score} | result: {cr.result}"
+        # The score, the comment and the token counts are collected in a single pass
+        score: int = 1
+        comment_parts: List[str] = []
+        validation_input_tokens = 0
+        validation_output_tokens = 0
+        for check, check_result in zip(checks, results):
+            if check_result.score == -1:
+                continue
+            summary = f"Check {check.CHECK_TYPE} | score: {check_result.score} | result: {check_result.result}"
+            console.print(summary)
+            comment_parts.append(f" 🔹 {summary}")
+            if check_result.score == 0:
+                score = 0
+            validation_input_tokens += check_result.validation_input_tokens
+            validation_output_tokens += check_result.validation_output_tokens
 
         testcaserun.ai_score = score
-        testcaserun.ai_comment = comment
-        testcaserun.validation_input_tokens = sum(
-            cr.validation_input_tokens for cr in check_results
-        )
-        testcaserun.validation_output_tokens = sum(
-            cr.validation_output_tokens for cr in check_results
-        )
+        testcaserun.ai_comment = "".join(comment_parts)
+        testcaserun.validation_input_tokens = validation_input_tokens
+        testcaserun.validation_output_tokens = validation_output_tokens
 
         return testcaserun
 
@@ -22,7 +22,7 @@ console = Console()
 
 
 class COTGeminiValidator(BaseValidator):
-    def __init__(self):
+    def __init__(self, results_dir: str = "."):
         self.model = genai.GenerativeModel(model_name="gemini-2.0-flash-001")  # type: ignore
 
         # NOTE: if you want to use `gemini-2.5-pro-exp-03-25` don't forget that:
@@ -40,13 +40,11 @@ class COTGeminiValidator(BaseValidator):
             768,
             768,
         )  # Maximum width/height for resized images; Gemini resizes to this size anyway
+        self.results_dir = results_dir  # screenshot paths are relative to it
 
-    def _resize_base64_image(self, base64_string: str) -> str:
-        """Resize a base64 image to reduce its size while maintaining aspect ratio"""
+    def _resize_image(self, img_data: bytes) -> str:
+        """Resize an image to reduce its size while maintaining aspect ratio, and base64 encode it"""
         try:
-            # Decode base64 to binary
-            img_data = base64.b64decode(base64_string)
-
             # Open image with Pillow
             img = Image.open(io.BytesIO(img_data))
 
@@ -61,21 +59,17 @@ class COTGeminiValidator(BaseValidator):
             return base64.b64encode(buffer.getvalue()).decode()
         except Exception as e:
             console.print(f"Warning: Failed to resize image: {e}", style="yellow")
-            return base64_string
+            return base64.b64encode(img_data).decode()
 
     def _generate_content_part_from_step(self, step: Step) -> dict[str, str] | None:
-        if step.screenshot and step.screenshot.startswith("data:image"):
-            # Extract base64 part after the comma
-            base64_part = step.screenshot.split(",", 1)[1]
-            resized_base64 = self._resize_base64_image(base64_part)
-            image_url = f"data:image/png;base64,{resized_base64}"
-        else:
-            image_url = step.screenshot if step else None
-        if image_url and image_url.startswith("data:image"):
-            mime_type = image_url.split(";")[0].split(":")[1]
-            base64_data = image_url.split(",")[1]
-            return {"mime_type": mime_type, "data": base64_data}
-        return None
+        # Screenshots are stored as files in the results directory, or inline in older runs
+        img_data = step.screenshot_bytes(self.results_dir)
+        if img_data is None:
+            return None
+        return {
+            "mime_type": step.screenshot_mime_type(),
+            "data": self._resize_image(img_data),
+        }
 
     def validate_check(self, check: Check, testcaserun: TestCaseRun) -> CheckResult:
         system_prompt = ""
@@ -827,11 +827,11 @@ def main():
                     st.markdown(f"**Action:** {run.result.action}")
 
                 with right_col:
-                    if run.result.screenshot and run.result.screenshot.startswith(
-                        "data:image"
-                    ):
+                    # Read only when shown, screenshots are files in the results directory
+                    screenshot = run.result.screenshot_bytes(results_dir)
+                    if screenshot:
                         st.image(
-                            run.result.screenshot,
+                            screenshot,
                             caption="Final screenshot",
                             use_container_width=True,
                         )
@@ -852,9 +852,10 @@ def main():
                             st.markdown(f"**Thought:** {step.thought}")
 
                     with right_col:
-                        if step.screenshot and step.screenshot.startswith("data:image"):
+                        screenshot = step.screenshot_bytes(results_dir)
+                        if screenshot:
                             st.image(
-                                step.screenshot,
+                                screenshot,
                                 caption=f"Screenshot for step {len(run.trajectory) - i + 1}",
                                 use_container_width=True,
                             )